@@ -0,0 +1,83 @@
+"""Micro-benchmark and golden-output check for Extractor.clean_string()
+
+Collects the text nodes of HTML files in the given directories (plus a fixed set of corner cases),
+normalizes them with Extractor.clean_string() and with the original regular expressions, and
+reports time per call and any strings on which the two disagree.
+"""
+
+import os, sys
+import re
+import time
+from optparse import OptionParser
+
+from BeautifulSoup import BeautifulSoup, BeautifulStoneSoup, NavigableString
+
+from content_extraction.extractor import Extractor
+
+
+CORNER_CASES = ['', ' ', 'a', ' a ', 'a  b', 'a\tb', '\n\na\r\n', '&quot;x&quot;', '&ldquo;x&rdquo;', 
+                '&amp;&#160;&#x41;&nbsp;', '& amp', 'a&b;c', '-NEWLINE-', 'a -NEWLINE- -NEWLINE-b',
+                ' -NEWLINE-a-NEWLINE- ', 'x\x0bx\x0cx', 'x\x1cx', u'caf\xe9  \xa0 x', u'\u2028 \u3000',
+                u'&QUOT;\u0439&#1081;', 'a - NEWLINE - b', '\v\f']
+
+
+def reference_clean_string(s):
+    """Extractor.clean_string() as originally implemented"""
+    s = re.sub('(?i)&\w*quo\w*;', '"', s)
+    s = re.sub('(?i)&#*\w+;', ' ', s)
+    s = re.sub('\s+', ' ', s)
+    s = re.sub(r'\s*(-NEWLINE-\s*)+', '\n', s)
+    s = re.sub('^\s+|\s+$', '', s)
+    return s
+
+
+def collect_strings(extractor, names):
+    strings = list(CORNER_CASES)
+    for name in names:
+        for path, dirs, files in os.walk(name):
+            for file in files:
+                filename = os.path.join(path, file)
+                if not extractor.is_html_file(filename):
+                    continue
+                html = open(filename).read()
+                soup = BeautifulSoup(html, convertEntities=BeautifulStoneSoup.HTML_ENTITIES)
+                texts = soup.findAll(text=lambda text: isinstance(text, NavigableString))
+                strings.extend(texts)
+                # Strings as built by Extractor.get_text()
+                strings.append('-NEWLINE-'.join(texts))
+    return strings
+
+
+def time_calls(function, strings, repeat):
+    start = time.time()
+    for i in xrange(repeat):
+        for s in strings:
+            function(s)
+    return (time.time() - start) / (repeat * max(len(strings), 1))
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options] [input_dirs...]",
+                          description=__doc__)
+    parser.add_option("-n", "--repeat", dest="repeat", type='int', default=10,
+                      help="number of times each string is cleaned (default: 10)")
+    (options, params) = parser.parse_args()
+
+    extractor = Extractor()
+    strings = collect_strings(extractor, params)
+
+    mismatches = []
+    for s in strings:
+        expected, actual = reference_clean_string(s), extractor.clean_string(s)
+        if expected != actual or type(expected) != type(actual):
+            mismatches.append((s, expected, actual))
+
+    reference_time = time_calls(reference_clean_string, strings, options.repeat)
+    new_time = time_calls(extractor.clean_string, strings, options.repeat)
+
+    print "strings:     %d" % len(strings)
+    print "original:    %.2f us/call" % (1e6 * reference_time)
+    print "precompiled: %.2f us/call" % (1e6 * new_time)
+    print "mismatches:  %d" % len(mismatches)
+    for s, expected, actual in mismatches:
+        print "    %r: expected %r, got %r" % (s, expected, actual)
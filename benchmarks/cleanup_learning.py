@@ -0,0 +1,60 @@
+"""Compare memory use and time of cleanup model learning modes
+
+Learns a cleanup model from the given files/directories with each mode of CleanupModelLearner
+(texts in dictionaries, compact digest counts and approximate counts in a sketch), each in a 
+separate process, and reports learning time, peak memory and how the resulting models differ
+from the exact one.
+"""
+
+import os, sys
+import time
+import resource
+import multiprocessing
+from optparse import OptionParser
+
+from content_extraction.cleanup import CleanupModelLearner
+
+
+MODES = [('texts', {}),
+         ('compact', {'compact': True}),
+         ('sketch', {'sketch_memory': 16})]
+
+
+def learn(input_files, options, queue):
+    sys.stderr = open(os.devnull, 'w')
+    start = time.time()
+    learner = CleanupModelLearner(**options)
+    learner.extract(files=input_files)
+    model = learner.get_model()
+    seconds = time.time() - start
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((model, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options] input_files_or_dirs...",
+                          description=__doc__)
+    parser.add_option("-d", "--max_duplicates", dest="max_duplicates", type='int', default=2,
+                      help="maximum number of duplicate files in the input dataset (default: 2)")
+    (options, params) = parser.parse_args()
+
+    if len(params) < 1:
+        parser.print_help()
+        exit(1)
+
+    models = []
+    for name, mode_options in MODES:
+        mode_options = dict(mode_options, max_duplicates=options.max_duplicates)
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=learn, args=(params, mode_options, queue))
+        process.start()
+        model, seconds, maxrss = queue.get()
+        process.join()
+        models.append(model)
+        print "%-10s %8.2f s   peak memory %8.1f MB   %d paths in the model" % (name, seconds, maxrss / 1024.0, len(model))
+
+    for (name, mode_options), model in zip(MODES[1:], models[1:]):
+        paths = set(model) | set(models[0])
+        difference = max([abs(model.get(path, 0.0) - models[0].get(path, 0.0)) for path in paths] or [0.0])
+        print "%s model identical to %s model: %s (max. score difference %.4f)" % \
+              (name, MODES[0][0], model == models[0], difference)
@@ -0,0 +1,199 @@
+"""Generate synthetic corpora of crawled pages for benchmarks
+
+Writes pages of three kinds of sites, with the structures targeted by the example extractors
+and the boilerplate (navigation, scripts, styles, comments, footers) that cleanup models
+learn to remove:
+
+ - shavemyface/forum: phpBB topics (posts with quotes, signatures and links) and user
+   profiles, as handled by examples/shavemyface.py
+ - menessentials/forum: phpBB topics of another template, as handled by
+   examples/menessentials.py
+ - lenta/news: table-heavy news articles and story pages in windows-1251, as handled by
+   examples/lenta.py
+
+Pages are generated deterministically from a seed; their number and size are configurable.
+"""
+
+import os, sys
+import random
+from optparse import OptionParser
+
+
+WORDS = ("lorem ipsum dolor sit amet razor blade soap brush lather shave cream badger "
+         "&amp; &quot;quoted&quot; caf&eacute; consectetur adipiscing elit sed do eiusmod").split()
+
+RUSSIAN_WORDS = [u'\u043d\u043e\u0432\u043e\u0441\u0442\u0438', u'\u0441\u0435\u0433\u043e\u0434\u043d\u044f',
+                 u'\u043f\u0440\u0430\u0432\u0438\u0442\u0435\u043b\u044c\u0441\u0442\u0432\u043e',
+                 u'\u0433\u043e\u0440\u043e\u0434', u'\u0441\u043e\u043e\u0431\u0449\u0438\u043b',
+                 u'\u0433\u043e\u0434\u0430', u'\u0432', u'\u0438', u'\u043d\u0430', u'&quot;\u0420\u0418\u0410&quot;']
+
+
+class CorpusGenerator:
+    """Generate pages of synthetic sites"""
+
+    def __init__(self, seed=1, posts=20, paragraphs=8):
+        self.random = random.Random(seed)
+        self.posts = posts
+        self.paragraphs = paragraphs
+
+    def words(self, count, words=WORDS):
+        return u' '.join([self.random.choice(words) for i in xrange(count)])
+
+    def boilerplate(self, site):
+        """Navigation, scripts and styles shared by the pages of a site"""
+        head = (u'<script type="text/javascript">var site = "%s"; document.write("<b>" + site + "</b>");</script>'
+                u'<style type="text/css">td { font-size: 10px; }</style>' % site)
+        nav = (u'<table class="nav" width="100%%"><tr><td class="menu"><a href="index.php">%s</a> | '
+               u'<a href="faq.php">FAQ</a> | <a href="search.php">Search</a> | '
+               u'<a href="memberlist.php">Memberlist</a></td></tr></table>' % site)
+        footer = (u'<!-- footer --><div class="copyright">Powered by phpBB &copy; 2001, 2005 phpBB Group'
+                  u'<br/>All times are GMT</div><iframe src="ads.html"></iframe>')
+        return head, nav, footer
+
+    def shavemyface_topic(self, topic_id):
+        head, nav, footer = self.boilerplate('shavemyface')
+        rows = []
+        for i in xrange(self.posts):
+            user = self.random.randrange(1, 50)
+            quote = u''
+            if self.random.random() < 0.3:
+                quote = (u'<table width="90%%"><tr><td><span class="genmed"><b>user%d wrote:</b></span></td></tr>'
+                         u'<tr><td class="quote">%s</td></tr></table>' % (self.random.randrange(1, 50), self.words(15)))
+            rows.append(u'<tr><td class="row1" id="p%d"><span class="name"><b>user%d</b></span><br/>'
+                        u'<span class="postdetails">Joined: 02 Jan 2005<br />Posts: %d</span></td>\n'
+                        u'<td class="row1"><table width="100%%"><tr><td><span class="postdetails">'
+                        u'Posted: Mon Jan %02d, 2006 %d:%02d am<br/>Post subject: %s</span></td></tr>\n'
+                        u'<tr><td><span class="postbody">%s<br />%s <a href="http://example.com/%d">link</a></span>%s'
+                        u'<span class="postbody"></span><span class="gensmall">_________________<br />signature of user%d'
+                        u'</span></td></tr></table></td></tr>\n'
+                        u'<tr><td class="spaceRow"><a href="profile.php?mode=viewprofile&amp;u=%d">profile</a> '
+                        u'<a href="privmsg.php?mode=post&amp;u=%d">pm</a></td></tr>' %
+                        (i, user, self.random.randrange(1, 5000), 1 + i % 28, 1 + i % 12, i % 60, self.words(4),
+                         self.words(self.random.randrange(20, 120)), self.words(10), i, quote, user, user, user))
+        return (u'<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">\n'
+                u'<html><head><title>Shavemyface :: Topic %d</title>%s</head>\n<body><!-- header -->%s\n'
+                u'<a class="nav" href="viewforum.php?f=%d">Shaving forum %d</a>\n'
+                u'<a class="maintitle" href="viewtopic.php?t=%d">%s</a><wbr>\n'
+                u'<table class="forumline" width="100%%">%s</table>\n%s%s</body></html>' %
+                (topic_id, head, nav, topic_id % 7, topic_id % 7, topic_id, self.words(5), u'\n'.join(rows), nav, footer))
+
+    def shavemyface_profile(self, user_id):
+        head, nav, footer = self.boilerplate('shavemyface')
+        return (u'<html><head><title>Shavemyface :: Profile</title>%s</head><body>%s\n'
+                u'<table class="forumline"><tr><th class="thHead" colspan="2">Viewing profile :: user%d</th></tr>\n'
+                u'<tr><td><img src="images/avatars/%d.gif" alt="" /></td></tr>\n'
+                u'<tr><td><span class="gen">Joined:&nbsp;</span></td><td><span class="gen">02 Jan 2006</span></td></tr>\n'
+                u'<tr><td><span class="gen">Location:&nbsp;</span></td><td><span class="gen">%s</span></td></tr>\n'
+                u'<tr><td><span class="gen">Interests:&nbsp;</span></td><td><span class="gen">%s</span></td></tr>'
+                u'</table>%s%s</body></html>' % (head, nav, user_id, user_id, self.words(2), self.words(6), nav, footer))
+
+    def menessentials_topic(self, topic_id):
+        head, nav, footer = self.boilerplate('menessentials')
+        posts = []
+        for i in xrange(self.posts):
+            user = self.random.randrange(1, 50)
+            quote = u''
+            if self.random.random() < 0.3:
+                quote = (u'<table class="quote"><tr><td class="quote_user">user%d wrote:</td></tr>'
+                         u'<tr><td class="quote">%s</td></tr></table>' % (self.random.randrange(1, 50), self.words(15)))
+            posts.append(u'<tr><td class="row1"><span class="name"><a href="profile.php?mode=viewprofile&amp;u=%d">'
+                         u'user%d</a></span><br /><span class="postdetails">Posts: %d</span></td>\n'
+                         u'<td class="row1"><span class="postdate">Posted: Mon Jan %02d, 2006 %d:%02d pm</span>\n'
+                         u'<div class="postbody">%s%s<br />%s <a href="http://example.com/%d">link</a></div>'
+                         u'<div class="signature">signature of user%d</div></td></tr>' %
+                         (user, user, self.random.randrange(1, 5000), 1 + i % 28, 1 + i % 12, i % 60, quote,
+                          self.words(self.random.randrange(20, 120)), self.words(10), i, user))
+        return (u'<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">\n'
+                u'<html><head><title>Menessentials :: Topic %d</title>%s</head>\n<body>%s\n'
+                u'<table width="100%%"><tr><td class="navbar-links"><a href="index.php">Forum Index</a> &raquo; '
+                u'<a href="viewforum.php?f=%d">Shaving %d</a></td></tr></table>\n'
+                u'<table><tr><td class="content content-navbar"><table><tr><td><span class="gen">'
+                u'<a href="viewtopic.php?t=%d"><b>%s</b></a></span></td></tr></table></td></tr></table>\n'
+                u'<table class="forumline">%s</table>\n%s%s</body></html>' %
+                (topic_id, head, nav, topic_id % 5, topic_id % 5, topic_id, self.words(5), u'\n'.join(posts), nav, footer))
+
+    def lenta_article(self, article_id):
+        categories = u''.join([u'<a href="/%s/">%s</a> ' % (word, word) for word in ['russia', 'world', 'economy']])
+        paragraphs = u'\n'.join([u'<p>%s</p>' % self.words(self.random.randrange(20, 80), RUSSIAN_WORDS)
+                                for i in xrange(self.paragraphs)])
+        links = u' '.join([u'<a href="/news/2008/01/%02d/%d/">%s</a>' % (1 + i, article_id + i, self.words(4, RUSSIAN_WORDS))
+                           for i in xrange(3)])
+        menu_rows = u'\n'.join([u'<tr><td class="menu"><a href="/%s/">%s</a></td><td class="sep">|</td></tr>' % (word, word)
+                                for word in ['russia', 'world', 'economy', 'science', 'sport', 'culture', 'internet']])
+        return (u'<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1251">'
+                u'<title>Lenta.ru: %s</title><script>var counter = %d;</script></head><body>\n'
+                u'<table class="shapka" width="100%%"><tr><td><div class="h">%s</div></td></tr></table>\n'
+                u'<table width="100%%"><tr><td valign="top"><table class="menu">%s</table></td>\n'
+                u'<td class="statya"><table><tr><td><div class="dt">%02d.01.2008, %02d:%02d:%02d</div></td></tr></table>\n'
+                u'<h2>%s</h2>\n%s\n<table class="photo"><tr><td><img src="/photo/%d.jpg"></td></tr></table>\n'
+                u'<p class="links">%s</p>\n'
+                u'<table class="vrezka"><tr><td><a href="/story/%d/">story</a> <a href="/comments/%d/">comments</a></td></tr></table>\n'
+                u'<table class="bottom-menu"><tr><td><a href="/print/%d/">print</a></td></tr></table></td>\n'
+                u'<td valign="top"><table class="banners"><tr><td><iframe src="/ads/"></iframe></td></tr></table></td></tr></table>\n'
+                u'<table class="footer" width="100%%"><tr><td>&copy; Lenta.ru 1999-2008</td></tr></table></body></html>' %
+                (self.words(5, RUSSIAN_WORDS), article_id, categories, menu_rows, 1 + article_id % 28, article_id % 24,
+                 article_id % 60, article_id % 60, self.words(6, RUSSIAN_WORDS), paragraphs, article_id, links,
+                 article_id, article_id, article_id))
+
+    def lenta_story(self, story_id):
+        items = u'\n'.join([u'<tr><td class="date">%02d.01</td><td><a href="/news/2008/01/%02d/%d/">%s</a></td></tr>' %
+                            (1 + i % 28, 1 + i % 28, story_id * 100 + i, self.words(6, RUSSIAN_WORDS))
+                            for i in xrange(self.paragraphs * 3)])
+        return (u'<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1251">'
+                u'<title>Lenta.ru: %s</title></head><body>\n'
+                u'<table class="shapka" width="100%%"><tr><td><div class="h"><a href="/story/">story</a></div></td></tr></table>\n'
+                u'<table class="line">%s</table>\n'
+                u'<table class="footer" width="100%%"><tr><td>&copy; Lenta.ru 1999-2008</td></tr></table></body></html>' %
+                (self.words(4, RUSSIAN_WORDS), items))
+
+    def generate(self, directory, pages=100):
+        """Write a corpus with the given number of pages per site to a directory; return the
+        directories of the sites: site name -> directory"""
+
+        sites = {'shavemyface': os.path.join(directory, 'shavemyface', 'forum'),
+                 'menessentials': os.path.join(directory, 'menessentials', 'forum'),
+                 'lenta': os.path.join(directory, 'lenta', 'news')}
+        for site_dir in sites.values():
+            if not os.path.isdir(site_dir):
+                os.makedirs(site_dir)
+
+        profiles = max(1, pages / 10)
+        for i in xrange(1, pages - profiles + 1):
+            write(sites['shavemyface'], 'viewtopic.php?t=%d' % i, self.shavemyface_topic(i))
+        for i in xrange(1, profiles + 1):
+            write(sites['shavemyface'], 'profile.php?mode=viewprofile&u=%d' % i, self.shavemyface_profile(i))
+        for i in xrange(1, pages + 1):
+            write(sites['menessentials'], 'viewtopic.php?t=%d' % i, self.menessentials_topic(i))
+        stories = max(1, pages / 10)
+        for i in xrange(1, pages - stories + 1):
+            write(sites['lenta'], 'article%d.html' % i, self.lenta_article(i), 'windows-1251')
+        for i in xrange(1, stories + 1):
+            write(sites['lenta'], 'story%d.html' % i, self.lenta_story(i), 'windows-1251')
+        return sites
+
+
+def write(directory, name, page, encoding='utf-8'):
+    f = open(os.path.join(directory, name), 'wb')
+    f.write(page.encode(encoding))
+    f.close()
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options] output_dir", description=__doc__)
+    parser.add_option("-n", "--pages", dest="pages", type='int', default=100,
+                      help="number of pages per site (default: 100)")
+    parser.add_option("--posts", dest="posts", type='int', default=20,
+                      help="number of posts per forum topic (default: 20)")
+    parser.add_option("--paragraphs", dest="paragraphs", type='int', default=8,
+                      help="number of paragraphs per news article (default: 8)")
+    parser.add_option("-s", "--seed", dest="seed", type='int', default=1,
+                      help="seed of the random generator (default: 1)")
+    (options, params) = parser.parse_args()
+
+    if len(params) != 1:
+        parser.print_help()
+        exit(1)
+
+    generator = CorpusGenerator(options.seed, options.posts, options.paragraphs)
+    for site, site_dir in sorted(generator.generate(params[0], options.pages).items()):
+        print site, site_dir
@@ -0,0 +1,61 @@
+"""Compare in-process HTML detection (Extractor.is_html_file) with the 'file' command
+
+For all files in the given directories, checks whether the file is HTML using both methods,
+reports the time spent by each method and lists files on which the methods disagree.
+"""
+
+import os, sys
+import subprocess
+import time
+from optparse import OptionParser
+
+from content_extraction.extractor import Extractor
+
+
+def is_html_file_command(filename):
+    """Detection as done by the 'file' command (two processes per file)"""
+    return subprocess.call('file "%s" | grep -q HTML' % filename, shell=True) == 0
+
+
+def list_files(names):
+    filenames = []
+    for name in names:
+        if os.path.isdir(name):
+            for path, dirs, files in os.walk(name):
+                filenames.extend([os.path.join(path, file) for file in files])
+        else:
+            filenames.append(name)
+    return filenames
+
+
+def time_detection(detect, filenames):
+    start = time.time()
+    decisions = [detect(filename) for filename in filenames]
+    return decisions, time.time() - start
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog input_files_or_dirs...",
+                          description=__doc__)
+    (options, params) = parser.parse_args()
+
+    if len(params) < 1:
+        parser.print_help()
+        exit(1)
+
+    filenames = list_files(params)
+    extractor = Extractor()
+
+    command_decisions, command_time = time_detection(is_html_file_command, filenames)
+    sniff_decisions, sniff_time = time_detection(extractor.is_html_file, filenames)
+
+    mismatches = [(filename, command, sniff) 
+                  for filename, command, sniff in zip(filenames, command_decisions, sniff_decisions)
+                  if command != sniff]
+
+    print "files:            %d (%d HTML according to 'file')" % (len(filenames), command_decisions.count(True))
+    print "'file' command:   %.3f s (%.3f ms/file)" % (command_time, 1000.0 * command_time / max(len(filenames), 1))
+    print "in-process sniff: %.3f s (%.3f ms/file)" % (sniff_time, 1000.0 * sniff_time / max(len(filenames), 1))
+    print "mismatches:       %d" % len(mismatches)
+    for filename, command, sniff in mismatches:
+        print "    %s: file=%s, sniff=%s" % (filename, command, sniff)
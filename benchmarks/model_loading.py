@@ -0,0 +1,75 @@
+"""Compare loading time and lookup speed of cleanup model formats
+
+Generates a synthetic cleanup model with a given number of paths, stores it in each format
+(Python dictionary, pickle, binary), and reports the time to load it, the time per lookup 
+and the growth of resident memory caused by loading (Linux only).
+"""
+
+import os, sys
+import time
+import random
+import tempfile
+import cPickle
+import multiprocessing
+from optparse import OptionParser
+
+from content_extraction.models import dump_binary_model, load_cleanup_model
+
+
+def make_model(paths):
+    random.seed(0)
+    tags = ['table', 'tr', 'td.row1', 'td.row2', 'div#1', 'span.postbody', 'span.gen', 'a', 'b', 'p']
+    model = dict()
+    while len(model) < paths:
+        path = u'/html/body/' + u'/'.join([random.choice(tags) for i in xrange(random.randint(3, 12))]) + \
+               u'/@%d' % random.randint(1, 9)
+        model[path] = random.random()
+    return model
+
+
+def resident_memory():
+    """Resident memory of this process in bytes"""
+    return int(open('/proc/self/statm').read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(filename, lookups, queue):
+    memory = resident_memory()
+    start = time.time()
+    model = load_cleanup_model(filename)
+    load_time = time.time() - start
+    memory = resident_memory() - memory
+
+    start = time.time()
+    for path in lookups:
+        model.get(path)
+    lookup_time = (time.time() - start) / len(lookups)
+    queue.put((load_time, lookup_time, memory))
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-n", "--paths", dest="paths", type='int', default=200000,
+                      help="number of paths in the model (default: 200000)")
+    (options, params) = parser.parse_args()
+
+    model = make_model(options.paths)
+    lookups = random.sample(list(model), min(10000, len(model))) + [u'/html/body/missing/@%d' % i for i in xrange(1000)]
+
+    contents = [('python', repr(model)),
+                ('pickle', cPickle.dumps(model, -1)),
+                ('binary', dump_binary_model(model))]
+
+    for name, content in contents:
+        fd, filename = tempfile.mkstemp(suffix='.model')
+        os.write(fd, content)
+        os.close(fd)
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(filename, lookups, queue))
+        process.start()
+        load_time, lookup_time, memory = queue.get()
+        process.join()
+        os.remove(filename)
+
+        print "%-7s %8.1f MB file   load %8.3f s   lookup %6.2f us   memory %8.1f MB" % \
+              (name, len(content) / 2.0**20, load_time, 1e6 * lookup_time, memory / 2.0**20)
@@ -0,0 +1,81 @@
+"""Benchmark of saving per-file outputs: output sinks (content_extraction/sinks.py)
+
+Saves a number of small outputs, spread over directories, into a temporary directory (give
+another one with -d, e.g. on a network filesystem): one by one as originally done by the
+extractor (existence check, directory check, open, write, close for each output), with a
+DirectorySink and with a TarSink. Each run starts with an empty directory, and is followed
+by a second run over the same names that skips existing outputs. Reports times and the
+number of files created.
+"""
+
+import os, sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+from content_extraction.sinks import Output, DirectorySink, TarSink
+
+
+class ReferenceSink:
+    """Saving outputs as originally done by Extractor._extract_from_prepared_file()"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def write(self, output):
+        filename = os.path.join(self.directory, output.name)
+        dir_name = os.path.dirname(filename)
+        if dir_name and not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        f = open(filename, 'w')
+        print >>f, output.data
+        f.close()
+
+    def close(self):
+        pass
+
+
+def make_outputs(count, directories, size):
+    data = ('<items filename="x">' + 'text ' * (size / 5) + '</items>')[:size]
+    return [Output('site%d/page%d.xml' % (i % directories, i), data) for i in xrange(count)]
+
+
+def count_files(directory):
+    return sum([len(files) for path, dirs, files in os.walk(directory)])
+
+
+def run(sink, outputs):
+    start = time.time()
+    for output in outputs:
+        if not sink.exists(output.name):
+            sink.write(output)
+    sink.close()
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-n", "--outputs", dest="outputs", type='int', default=20000,
+                      help="number of outputs (default: 20000)")
+    parser.add_option("-s", "--size", dest="size", type='int', default=2000,
+                      help="size of an output in bytes (default: 2000)")
+    parser.add_option("-d", "--directory", dest="directory", default=None,
+                      help="directory where to write (default: a temporary directory)")
+    (options, params) = parser.parse_args()
+
+    sys.stderr = open(os.devnull, 'w')
+    outputs = make_outputs(options.outputs, 100, options.size)
+    sinks = [('one by one', ReferenceSink),
+             ('directory sink', DirectorySink),
+             ('tar sink', lambda directory: TarSink(os.path.join(directory, 'outputs.tar')))]
+    for name, make_sink in sinks:
+        directory = tempfile.mkdtemp(dir=options.directory)
+        seconds = run(make_sink(directory), outputs)
+        seconds_skipping = run(make_sink(directory), outputs)
+        print "%-16s %8.2f s   rerun (skipping) %8.2f s   %6d files created" % \
+              (name, seconds, seconds_skipping, count_files(directory))
+        shutil.rmtree(directory)
@@ -0,0 +1,93 @@
+"""Conformance check and benchmark of HTML parsers (see content_extraction/parsers.py)
+
+Parses the given HTML files with each parser and reports the parsing time. Then runs
+extractors on the files with each parser and compares their outputs file by file: the cleanup
+extractor (with a model learned from the same files with the same parser; XML and text
+output) and the example extractors (examples/*.py, unless extractors are given with -x).
+
+Exits with status 1 if any output differs between the parsers.
+"""
+
+import os, sys
+import imp
+import glob
+import time
+from optparse import OptionParser
+
+from content_extraction.extractor import Extractor
+from content_extraction.cleanup import CleanupModelLearner, PageCleaner
+from content_extraction.parsers import PARSERS, get_parser
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', '*.py')
+
+
+def load_extractor(filename):
+    module = imp.load_source(os.path.basename(filename).replace('.py', ''), filename)
+    return module.extractor
+
+
+def run(extractor, filenames):
+    """Return the outputs of an extractor for each file"""
+    outputs = []
+    for filename in filenames:
+        results = [result for result in extractor.extract(files=[filename]) if result is not None]
+        outputs.append(results)
+    return outputs
+
+
+def extractor_outputs(parser, filenames, extractors):
+    """Return a list of (name, outputs for each file) of all extractors, with a given parser"""
+    learner = CleanupModelLearner(parser=parser)
+    learner.extract(files=filenames)
+    model = learner.get_model()
+
+    outputs = []
+    for output_format in ['xml', 'txt']:
+        cleaner = PageCleaner(cleanup_model=model, parser=parser, output_format=output_format)
+        outputs.append(('cleanup (%s)' % output_format, run(cleaner, filenames)))
+    for filename in extractors:
+        extractor = load_extractor(filename)(parser=parser)
+        outputs.append((os.path.basename(filename), run(extractor, filenames)))
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options] input_files_or_dirs...", description=__doc__)
+    parser.add_option("-x", "--extractor", dest="extractors", action="append", metavar="FILE", default=[],
+                      help="extractor to compare, besides cleanup (default: examples/*.py); can be repeated")
+    (options, params) = parser.parse_args()
+
+    if len(params) < 1:
+        parser.print_help()
+        exit(1)
+
+    sys.stderr = open(os.devnull, 'w')
+    extractors = options.extractors or sorted(glob.glob(EXAMPLES))
+    parsers = sorted(PARSERS)
+
+    extractor = Extractor()
+    filenames = [filename for filename, relative_filename in extractor._iter_input_files(params)
+                 if extractor.is_html_file(filename)]
+    htmls = [open(filename).read() for filename in filenames]
+    encodings = [extractor.encoding_detector.detect(html, filename)[0] for html, filename in zip(htmls, filenames)]
+
+    print "%d pages" % len(htmls)
+    for name in parsers:
+        parse_html = get_parser(name)
+        start = time.time()
+        for html, encoding in zip(htmls, encodings):
+            parse_html(html, encoding)
+        print "%-14s parsing: %8.2f ms/page" % (name, 1000 * (time.time() - start) / len(htmls))
+
+    all_outputs = [extractor_outputs(name, filenames, extractors) for name in parsers]
+    differences = 0
+    for i, (extractor_name, outputs) in enumerate(all_outputs[0]):
+        different = [filename for j, filename in enumerate(filenames)
+                     if [other[i][1][j] for other in all_outputs[1:] if other[i][1][j] != outputs[j]]]
+        differences += len(different)
+        print "%-22s identical output for %d of %d files" % (extractor_name, len(filenames) - len(different), len(filenames))
+        for filename in different[:5]:
+            print "    differs:", filename
+
+    exit(differences and 1 or 0)
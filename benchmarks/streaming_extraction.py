@@ -0,0 +1,56 @@
+"""Compare memory use and time of Extractor.extract() and Extractor.iter_extract()
+
+Runs an extractor (examples/shavemyface.py unless another one is given with -x) over the given
+files/directories, each mode in a separate process: extract() collecting all results in a list,
+iter_extract() consuming results one by one, and iter_extract() with a prefetch thread reading
+files ahead. Reports time, peak memory and the number of results of each mode.
+"""
+
+import os, sys
+import imp
+import time
+import resource
+import multiprocessing
+from optparse import OptionParser
+
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'shavemyface.py')
+
+MODES = ['extract', 'iter_extract', 'iter_extract (prefetch)']
+
+
+def run(extractor_file, mode, input_files, prefetch, queue):
+    sys.stderr = open(os.devnull, 'w')
+    module = imp.load_source(os.path.basename(extractor_file).replace('.py', ''), extractor_file)
+    extractor = module.extractor(prefetch=mode.endswith('(prefetch)') and prefetch or 0)
+    start = time.time()
+    if mode == 'extract':
+        count = len(extractor.extract(files=input_files))
+    else:
+        count = 0
+        for source, result in extractor.iter_extract(files=input_files):
+            count += 1
+    seconds = time.time() - start
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, count))
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options] input_files_or_dirs...", description=__doc__)
+    parser.add_option("-x", "--extractor", dest="extractor", metavar="FILE", default=EXAMPLE,
+                      help="extractor to run (default: examples/shavemyface.py)")
+    parser.add_option("--prefetch", dest="prefetch", type='int', default=8,
+                      help="number of files read ahead in the prefetch mode (default: 8)")
+    (options, params) = parser.parse_args()
+
+    if len(params) < 1:
+        parser.print_help()
+        exit(1)
+
+    for mode in MODES:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(options.extractor, mode, params, options.prefetch, queue))
+        process.start()
+        seconds, maxrss, count = queue.get()
+        process.join()
+        print "%-24s %8.2f s   peak memory %8.1f MB   %d results" % (mode, seconds, maxrss / 1024.0, count)
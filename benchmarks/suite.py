@@ -0,0 +1,228 @@
+"""Benchmark suite: end-to-end and per-stage times on a synthetic corpus, saved for comparison
+
+Generates a corpus of synthetic pages (see corpus.py: phpBB forums as targeted by
+examples/shavemyface.py and examples/menessentials.py, table-heavy news pages as targeted by
+examples/lenta.py) and times, for each site:
+
+ - learn/<site>: learning a cleanup model (CleanupModelLearner)
+ - clean/<site>: cleaning the pages with the learned model (PageCleaner), with XML output
+ - extract/<site>: the example extractor of the site, with XML output
+ - soup_to_text/<site>: rendering the pages cleaned by PageCleaner as text (Extractor.soup_to_text())
+ - format/<site>: formatting the results of the example extractor as XML (Extractor.format_result();
+   it replaced Extractor.serialize_to_xml())
+
+End-to-end runs report the time by processing stage (see content_extraction/instrumentation.py).
+Each benchmark is run several times and the fastest run is kept. Results are written to a JSON
+file (with the git commit, the Python version and the corpus parameters); give the results of a
+previous run with -c to compare: benchmarks slower by more than the tolerance are reported, and
+the exit status is 1 if there are any.
+"""
+
+import os, sys
+import gc
+import re
+import imp
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+from content_extraction.extractor import Extractor
+from content_extraction.cleanup import CleanupModelLearner, PageCleaner
+from corpus import CorpusGenerator
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'examples')
+
+SITES = ['shavemyface', 'menessentials', 'lenta']
+
+RESULTS_VERSION = 1
+
+
+def load_example(name):
+    """Return the extractor class of an example module in examples/"""
+    return imp.load_source('example_' + name, os.path.join(EXAMPLES_DIR, name + '.py')).extractor
+
+
+def list_files(directory):
+    return sorted([os.path.join(directory, name) for name in os.listdir(directory)])
+
+
+def extract_results(extractor, filenames):
+    """Parse, clean up and extract from files; return a list of (filename, result of extract_from_soup())"""
+
+    results = []
+    for filename in filenames:
+        html = open(filename).read()
+        encoding, method = extractor.encoding_detector.detect(html, filename)
+        soup = extractor.parse_html(re.sub('(?i)<wbr\s*\/?\s*>', '', html), encoding)
+        extractor.cleanup_soup(soup)
+        results.append((filename, extractor.extract_from_soup(soup, filename, os.path.basename(filename))))
+    return results
+
+
+def best_run(repeat, run):
+    """Call run() (which returns a dictionary with 'seconds') repeat times; return the fastest result"""
+
+    best = None
+    for i in xrange(repeat):
+        gc.collect()
+        result = run()
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def time_extraction(make_extractor, directory):
+    """Run an extractor over a directory (discarding output); return its time and times by stage"""
+
+    extractor = make_extractor()
+    output = open(os.devnull, 'w')
+    start, start_cpu = time.time(), time.clock()
+    extractor.extract(files=[directory], output=output)
+    seconds, cpu = time.time() - start, time.clock() - start_cpu
+    output.close()
+    summary = extractor.instrumentation.summary()
+    return {'seconds': seconds, 'cpu': cpu, 'pages': summary['pages'], 'stages': summary['stages']}
+
+
+def time_calls(function, items):
+    """Call function(item) for all items; return the time taken"""
+
+    start, start_cpu = time.time(), time.clock()
+    for item in items:
+        function(item)
+    return {'seconds': time.time() - start, 'cpu': time.clock() - start_cpu, 'pages': len(items)}
+
+
+def run_site(site, directory, repeat, selected):
+    """Run the benchmarks of a site; return a dictionary: benchmark name -> result"""
+
+    results = dict()
+
+    def run(name, function):
+        if selected and not [prefix for prefix in selected if name.startswith(prefix)]:
+            return
+        print >>sys.stderr, "Running", name
+        result = best_run(repeat, function)
+        result['ms_per_page'] = 1000 * result['seconds'] / max(result['pages'], 1)
+        results[name] = result
+
+    options = dict(quiet=True, instrument=True)
+    learner = CleanupModelLearner(quiet=True)
+    learner.extract(files=[directory])
+    model = learner.get_model()
+
+    run('learn/' + site,
+        lambda: time_extraction(lambda: CleanupModelLearner(**options), directory))
+    run('clean/' + site,
+        lambda: time_extraction(lambda: PageCleaner(cleanup_model=model, **options), directory))
+    extractor_class = load_example(site)
+    run('extract/' + site,
+        lambda: time_extraction(lambda: extractor_class(**options), directory))
+
+    filenames = list_files(directory)
+    cleaned = [res for filename, res in extract_results(PageCleaner(cleanup_model=model, quiet=True), filenames)
+               if res is not None]
+    run('soup_to_text/' + site, lambda: time_calls(Extractor.soup_to_text, cleaned))
+
+    extractor = extractor_class(quiet=True)
+    extracted = [(filename, res) for filename, res in extract_results(extractor, filenames) if res is not None]
+    run('format/' + site, lambda: time_calls(lambda (filename, res): extractor.format_result(res, filename), extracted))
+    return results
+
+
+def git_commit():
+    """Return the current git commit of the source tree (with '+' if it has changes), or None"""
+
+    source_dir = os.path.dirname(BENCHMARKS_DIR)
+    try:
+        process = subprocess.Popen(['git', 'describe', '--always', '--dirty=+'], cwd=source_dir,
+                                   stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+        commit = process.communicate()[0].strip()
+    except OSError:
+        return None
+    return process.returncode == 0 and commit or None
+
+
+def compare(previous, current, tolerance):
+    """Print a comparison of the times of two runs; return the names of benchmarks slower by more than tolerance"""
+
+    print "Comparison with %s (%s):" % (previous.get('commit'), previous.get('date'))
+    slower = []
+    for name in sorted(current['benchmarks']):
+        if name not in previous['benchmarks']:
+            continue
+        old = previous['benchmarks'][name]['ms_per_page']
+        new = current['benchmarks'][name]['ms_per_page']
+        change = old and (new - old) / old or 0.0
+        mark = ''
+        if change > tolerance:
+            mark = '  SLOWER'
+            slower.append(name)
+        elif change < -tolerance:
+            mark = '  faster'
+        print "    %-28s %9.3f ms/page -> %9.3f ms/page %+7.1f%%%s" % (name, old, new, 100 * change, mark)
+    return slower
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-o", "--output", dest="output", default="benchmark_results.json",
+                      help="file where to write the results, in JSON (default: benchmark_results.json)")
+    parser.add_option("-c", "--compare", dest="compare", default=None,
+                      help="file with results of a previous run to compare with")
+    parser.add_option("-t", "--tolerance", dest="tolerance", type='float', default=0.1,
+                      help="relative slowdown reported as a regression (default: 0.1)")
+    parser.add_option("-b", "--benchmark", dest="benchmarks", action="append", default=[],
+                      help="run only benchmarks whose names start with this (may be repeated), e.g. 'clean/' or 'extract/lenta'")
+    parser.add_option("-r", "--repeat", dest="repeat", type='int', default=3,
+                      help="number of runs of each benchmark; the fastest is kept (default: 3)")
+    parser.add_option("-n", "--pages", dest="pages", type='int', default=100,
+                      help="number of pages per site (default: 100)")
+    parser.add_option("--posts", dest="posts", type='int', default=20,
+                      help="number of posts per forum topic (default: 20)")
+    parser.add_option("--paragraphs", dest="paragraphs", type='int', default=8,
+                      help="number of paragraphs per news article (default: 8)")
+    parser.add_option("-s", "--seed", dest="seed", type='int', default=1,
+                      help="seed of the corpus generator (default: 1)")
+    parser.add_option("-d", "--corpus_dir", dest="corpus_dir", default=None,
+                      help="directory where to generate the corpus, kept after the run (default: a temporary directory)")
+    (options, params) = parser.parse_args()
+
+    corpus_dir = options.corpus_dir or tempfile.mkdtemp()
+    generator = CorpusGenerator(options.seed, options.posts, options.paragraphs)
+    sites = generator.generate(corpus_dir, options.pages)
+
+    results = {'version': RESULTS_VERSION,
+               'commit': git_commit(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'repeat': options.repeat,
+               'corpus': {'pages': options.pages, 'posts': options.posts,
+                          'paragraphs': options.paragraphs, 'seed': options.seed},
+               'benchmarks': dict()}
+    try:
+        for site in SITES:
+            results['benchmarks'].update(run_site(site, sites[site], options.repeat, options.benchmarks))
+    finally:
+        if not options.corpus_dir:
+            shutil.rmtree(corpus_dir)
+
+    f = open(options.output, 'w')
+    json.dump(results, f, indent=1, sort_keys=True)
+    f.write('\n')
+    f.close()
+
+    for name in sorted(results['benchmarks']):
+        result = results['benchmarks'][name]
+        print "%-28s %5d pages %8.3f s %9.3f ms/page" % (name, result['pages'], result['seconds'], result['ms_per_page'])
+
+    if options.compare:
+        previous = json.load(open(options.compare))
+        if compare(previous, results, options.tolerance):
+            exit(1)
@@ -0,0 +1,86 @@
+"""Benchmark of text rendering: Extractor.soup_to_text() and Extractor.get_text()
+
+Builds a synthetic forum page with a given number of text nodes, renders its text with the
+current implementation and with the original one (string concatenation), checks that the 
+outputs are identical and reports the time taken by each.
+"""
+
+import sys
+import re
+import time
+from optparse import OptionParser
+
+from BeautifulSoup import BeautifulSoup, Tag, Comment, Declaration, ProcessingInstruction
+
+from content_extraction.extractor import Extractor, BLOCK_LEVEL_TAGS
+
+
+def reference_soup_to_text(soup):
+    """Extractor.soup_to_text() as originally implemented"""
+    for node in soup.findAll(['script', 'style', 'iframe']) + \
+                soup.findAll(text=lambda text:isinstance(text, (Comment, Declaration, ProcessingInstruction))):
+        node.extract()
+    text = ''
+    for node in soup.findAll(['body']):
+        for e in node.recursiveChildGenerator():
+            if isinstance(e,unicode):
+                text += re.sub(r"\s+", " ", e)
+            elif isinstance(e, Tag) and e.name.lower() in BLOCK_LEVEL_TAGS:
+                text += "\n"
+    text = re.sub(r"\n\s*\n\s*\n", "\n", text)
+    return text
+
+
+def reference_get_text(extractor, node):
+    """Extractor.get_text() as originally implemented"""
+    text = ''
+    for e in node.recursiveChildGenerator():
+        if isinstance(e, Comment) or isinstance(e, Declaration) or isinstance(e, ProcessingInstruction):
+            pass
+        elif isinstance(e,unicode):
+            text += e
+        elif isinstance(e, Tag) and e.name.lower() in ('p', 'br'):
+            text += '-NEWLINE-'
+    return extractor.clean_string(text)
+
+
+def make_page(text_nodes):
+    """Generate a forum-like page with approximately the given number of text nodes"""
+    rows = []
+    for i in xrange(text_nodes / 4):
+        rows.append(u'<tr><td class="row%d"><b>user%d</b></td><td><p>Post number %d,\n  caf\xe9 &amp; more</p>'
+                    u'<br/>second\tline<!-- c --></td></tr>' % (i % 2, i, i))
+    return u'<html><head><title>Topic</title><script>var x;</script></head><body><table>%s</table></body></html>' % \
+           u'\n'.join(rows)
+
+
+def best_time(function, make_argument, repeat):
+    times = []
+    for i in xrange(repeat):
+        argument = make_argument()
+        start = time.time()
+        result = function(argument)
+        times.append(time.time() - start)
+    return result, min(times)
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-n", "--text_nodes", dest="text_nodes", type='int', default=20000,
+                      help="number of text nodes in the page (default: 20000)")
+    parser.add_option("-r", "--repeat", dest="repeat", type='int', default=3,
+                      help="number of runs; the best time is reported (default: 3)")
+    (options, params) = parser.parse_args()
+
+    extractor = Extractor()
+    html = make_page(options.text_nodes)
+    make_soup = lambda: BeautifulSoup(html)
+    make_body = lambda: BeautifulSoup(html).body
+
+    for name, reference, current, make_argument in [
+            ('soup_to_text', reference_soup_to_text, extractor.soup_to_text, make_soup),
+            ('get_text', lambda node: reference_get_text(extractor, node), extractor.get_text, make_body)]:
+        expected, reference_time = best_time(reference, make_argument, options.repeat)
+        actual, current_time = best_time(current, make_argument, options.repeat)
+        print "%-13s original: %8.3f s   current: %8.3f s   identical output: %s" % \
+              (name, reference_time, current_time, expected == actual and type(expected) == type(actual))
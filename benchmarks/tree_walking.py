@@ -0,0 +1,120 @@
+"""Benchmark of tree walking in cleanup: CleanupModelLearner.walk_elements() and
+PageCleaner.remove_empty_elements()
+
+Builds a deep (nested elements) and a wide (many siblings) synthetic page, walks them with
+the current, iterative implementation and with the original, recursive one, checks that the
+results are identical and reports the time taken by each. The original implementation fails
+on pages nested deeper than the recursion limit.
+"""
+
+import sys
+import copy
+import time
+from optparse import OptionParser
+
+from BeautifulSoup import BeautifulSoup, NavigableString, Tag
+
+from content_extraction.cleanup import CleanupModelLearner, PageCleaner, HEX_ID
+
+
+def reference_walk_elements(learner, soup, path = '/'):
+    """CleanupModelLearner.walk_elements() as originally implemented"""
+    count = 0
+    for node in soup.contents:
+        count += 1
+
+        if isinstance(node, NavigableString):
+            learner.visit_leaf_element(node, path + "@" + str(count))
+        elif isinstance(node, Tag):
+            attrs = ''
+            if node.get('class'):
+                attrs += '.' + node['class']
+            if node.get('id'):
+                node_id = HEX_ID.sub('1', node['id'])
+                attrs += '#' + node_id
+            reference_walk_elements(learner, node, path + node.name + attrs + '/')
+
+
+def reference_remove_empty_elements(cleaner, root):
+    """PageCleaner.remove_empty_elements() as originally implemented"""
+    nodes = copy.copy(root.contents)
+    for node in nodes:
+        if isinstance(node, NavigableString):
+            if not cleaner.clean_string(node.string):
+                node.extract()
+        elif isinstance(node, Tag):
+            reference_remove_empty_elements(cleaner, node)
+            if node.name not in ('br', 'hr'):
+                has_child_with_content = False
+                for child  in node.contents:
+                     if isinstance(child, NavigableString) \
+                        or (isinstance(child, Tag) and child.name not in ('br', 'hr')):
+                        has_child_with_content = True
+                        break
+                if not has_child_with_content:
+                    node.extract()
+
+
+def make_deep_page(depth):
+    """Generate a page with elements nested to the given depth"""
+    html = ''.join(['<div class="level" id="post%d"><span> </span>text %d<br/>' % (i, i) for i in xrange(depth)])
+    return '<html><body>%s%s</body></html>' % (html, '</div>' * depth)
+
+
+def make_wide_page(width):
+    """Generate a page with the given number of table rows, some of them empty"""
+    rows = ['<tr><td class="row%d"><b>user%d</b></td><td>post %d<span>  </span></td></tr><tr><td> </td></tr>' % (i % 2, i, i)
+            for i in xrange(width)]
+    return '<html><body><table>%s</table></body></html>' % ''.join(rows)
+
+
+def tree_signature(soup):
+    """Structure and texts of a tree, computed without recursion"""
+    return [isinstance(node, Tag) and (node.name, len(node.contents)) or unicode(node)
+            for node in soup.recursiveChildGenerator()]
+
+
+def learn(walk, html):
+    learner = CleanupModelLearner()
+    learner.local_elements = dict()
+    soup = BeautifulSoup(html)
+    start = time.time()
+    walk(learner, soup)
+    return learner.local_elements, time.time() - start
+
+
+def remove_empty(remove, html):
+    cleaner = PageCleaner(cleanup_model={"/": 0.0})
+    soup = BeautifulSoup(html)
+    start = time.time()
+    remove(cleaner, soup)
+    seconds = time.time() - start
+    return tree_signature(soup), seconds
+
+
+def compare(name, run, reference, current, html):
+    try:
+        expected, reference_time = run(reference, html)
+        reference_time = "%8.3f s" % reference_time
+    except RuntimeError, e:
+        expected, reference_time = None, "  failed (%s)" % e
+    actual, current_time = run(current, html)
+    print "%-31s original: %-40s current: %8.3f s   identical output: %s" % \
+          (name, reference_time, current_time, expected is None and 'n/a' or expected == actual)
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-d", "--depth", dest="depth", type='int', default=2000,
+                      help="nesting depth of the deep page (default: 2000)")
+    parser.add_option("-w", "--width", dest="width", type='int', default=5000,
+                      help="number of rows of the wide page (default: 5000)")
+    (options, params) = parser.parse_args()
+
+    for page, html in [('deep', make_deep_page(options.depth)),
+                       ('shallow', make_deep_page(min(options.depth, sys.getrecursionlimit() / 4))),
+                       ('wide', make_wide_page(options.width))]:
+        compare('walk_elements (%s)' % page, learn, reference_walk_elements,
+                lambda learner, soup: learner.walk_elements(soup), html)
+        compare('remove_empty_elements (%s)' % page, remove_empty, reference_remove_empty_elements,
+                lambda cleaner, soup: cleaner.remove_empty_elements(soup), html)
@@ -0,0 +1,145 @@
+"""Benchmark of XML output of extracted records: Extractor.format_result()
+
+Builds a synthetic forum topic with a given number of posts (with quotes, links, dates and
+special characters), formats it as XML with the current implementation (streamed to a file)
+and with the original one (a xml.dom.minidom document rendered with toprettyxml()), checks
+that the outputs are identical and reports the time taken and the growth of resident memory
+(Linux only) of each, measured in separate processes.
+"""
+
+import os, sys
+import re
+import time
+import tempfile
+import multiprocessing
+import xml.dom.minidom
+from datetime import datetime
+from optparse import OptionParser
+
+from content_extraction.extractor import Extractor
+from content_extraction.elements import Post, Quote
+
+
+def serialize_to_xml(extractor, obj, tag_name = 'items', parent = None, doc = None):
+    """Extractor.serialize_to_xml() as originally implemented"""
+    return_doc = False
+    if not doc:
+        doc = xml.dom.minidom.Document()
+        return_doc = True
+    if not parent:
+        parent = doc.createElement(tag_name)
+        doc.appendChild(parent)
+    if isinstance(obj, (int, datetime)):
+        res = doc.createElement(tag_name)
+        res.appendChild(doc.createTextNode(unicode(obj)))
+        parent.appendChild(res)
+    elif isinstance(obj, basestring):
+        res = doc.createElement(tag_name)
+        res.appendChild(doc.createTextNode(extractor.clean_string(obj)))
+        parent.appendChild(res)
+    elif isinstance(obj, list):
+        for elt in obj:
+            serialize_to_xml(extractor, elt, tag_name, parent, doc)
+    else:
+        tag_name = re.sub('.*\.', '', str(obj.__class__).lower())
+        res = doc.createElement(tag_name)
+        for elt in sorted(obj.__dict__):
+            serialize_to_xml(extractor, getattr(obj, elt), elt, res, doc)
+        parent.appendChild(res)
+    if return_doc:
+        return parent
+
+
+def nicer_writexml(self, writer, indent="", addindent="", newl=""):
+    """Element.writexml() as originally replaced by the extractor module"""
+    writer.write(indent+"<" + self.tagName)
+    attrs = self._get_attributes()
+    a_names = attrs.keys()
+    a_names.sort()
+    for a_name in a_names:
+        writer.write(" %s=\"" % a_name)
+        xml.dom.minidom._write_data(writer, attrs[a_name].value)
+        writer.write("\"")
+    if self.childNodes:
+        if len(self.childNodes) == 1 and self.childNodes[0].nodeType == xml.dom.minidom.Node.TEXT_NODE:
+            writer.write(">")
+            self.childNodes[0].writexml(writer, "", "", "")
+            writer.write("</%s>%s" % (self.tagName, newl))
+            return
+        writer.write(">%s"%(newl))
+        for node in self.childNodes:
+            node.writexml(writer,indent+addindent,addindent,newl)
+        writer.write("%s</%s>%s" % (indent,self.tagName,newl))
+    else:
+        writer.write("/>%s"%(newl))
+
+
+def reference_format_result(extractor, res, filename, output):
+    """Extractor.format_result() as originally implemented, for records"""
+    res = serialize_to_xml(extractor, res)
+    res.setAttribute('filename', filename)
+    print >>output, res.toprettyxml('    ', '\n', 'utf8')
+
+
+def make_topic(posts):
+    """Generate records of a forum topic with the given number of posts"""
+    records = []
+    for i in xrange(posts):
+        post = Post()
+        post.site_name = 'forum'
+        post.topic_name = u'Caf\xe9 & "bar" <%d>' % (i / 100)
+        post.date = datetime(2010, 1, 1 + i % 28, 12, 30)
+        post.post_id = str(i)
+        post.user_name = 'user%d' % (i % 37)
+        post.text = u'Post number %d,\n  with   some text & <markup> that is repeated. ' % i * 5
+        post.links = ['http://example.com/%d?a=1&b=2' % j for j in xrange(i % 3)]
+        if i % 4 == 0:
+            quote = Quote()
+            quote.user_name = 'user%d' % (i % 5)
+            quote.text = u'Quoted text \u2014 %d' % i
+            post.quote = [quote]
+        records.append(post)
+    return records
+
+
+def resident_memory():
+    """Resident memory of this process in bytes"""
+    return int(open('/proc/self/statm').read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(format_result, posts, filename, queue):
+    extractor = Extractor()
+    records = make_topic(posts)
+    output = open(filename, 'w')
+    memory = resident_memory()
+    start = time.time()
+    format_result(extractor, records, 'forum/viewtopic.php?t=1&start=0', output)
+    seconds = time.time() - start
+    memory = resident_memory() - memory
+    output.close()
+    queue.put((seconds, memory))
+
+
+if __name__ == "__main__":
+    parser = OptionParser("usage: %prog [options]", description=__doc__)
+    parser.add_option("-n", "--posts", dest="posts", type='int', default=5000,
+                      help="number of posts in the topic (default: 5000)")
+    (options, params) = parser.parse_args()
+
+    xml.dom.minidom.Element.writexml = nicer_writexml
+    outputs = []
+    for name, format_result in [('original', reference_format_result),
+                                ('current', lambda extractor, res, filename, output:
+                                                extractor.format_result(res, filename, output))]:
+        handle, filename = tempfile.mkstemp(suffix='.xml')
+        os.close(handle)
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(format_result, options.posts, filename, queue))
+        process.start()
+        seconds, memory = queue.get()
+        process.join()
+        outputs.append(open(filename).read())
+        os.remove(filename)
+        print "%-8s %8.3f s   memory growth %8.1f MB   output %8.1f MB" % \
+              (name, seconds, memory / 2.0**20, len(outputs[-1]) / 2.0**20)
+    print "identical output:", outputs[0] == outputs[1]
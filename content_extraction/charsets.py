@@ -0,0 +1,140 @@
+"""Detection of character encodings of HTML documents"""
+
+import os
+import re
+import time
+import codecs
+
+import chardet
+
+# Number of leading bytes searched for a <meta> charset declaration
+META_SNIFF_SIZE = 4096
+
+# Number of bytes of a document passed to chardet
+CHARDET_SIZE = 32 * 1024
+
+# Minimal chardet confidence for an encoding to be reused for other documents in a directory
+CACHE_CONFIDENCE = 0.9
+
+BOMS = [(codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF8, 'utf-8'),
+        (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+
+# Matches both <meta charset="..."> and <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET = re.compile(r'''(?i)<meta\s[^>]*?charset\s*=\s*["']?\s*([-\w.:]+)''')
+
+NON_ASCII = re.compile('[\x80-\xff]')
+
+
+class EncodingDetector:
+    """Guess character encodings of HTML documents.
+
+    The following methods are tried in order: byte order mark, <meta> charset declaration,
+    pure ASCII or valid UTF-8 content, the encoding detected earlier for other documents in
+    the same directory, and finally chardet on a part of the document.
+    """
+
+    def __init__(self, chardet_size=CHARDET_SIZE):
+        self.chardet_size = chardet_size
+
+        ## encodings detected by chardet, by directory
+        self.cache = dict()
+
+        ## detection statistics: (method, encoding) -> [number of documents, time]
+        self.stats = dict()
+
+    def detect(self, html, filename=None):
+        """Guess encoding of a string with an HTML document; return (encoding, method)"""
+
+        start = time.time()
+        encoding, method = self._detect(html, filename)
+
+        key = (method, encoding)
+        if key not in self.stats:
+            self.stats[key] = [0, 0.0]
+        self.stats[key][0] += 1
+        self.stats[key][1] += time.time() - start
+
+        return encoding, method
+
+    def _detect(self, html, filename):
+        for bom, encoding in BOMS:
+            if html.startswith(bom):
+                return encoding, 'bom'
+
+        match = META_CHARSET.search(html, 0, META_SNIFF_SIZE)
+        if match:
+            encoding = match.group(1)
+            # Documents without BOM that declare UTF-16/32 are in fact ASCII-compatible
+            if self.is_known(encoding) and not encoding.lower().startswith(('utf-16', 'utf16', 'utf-32', 'utf32')):
+                return encoding, 'meta'
+
+        first_non_ascii = NON_ASCII.search(html)
+        if not first_non_ascii:
+            return 'ascii', 'ascii'
+
+        if self.can_decode(html, 'utf-8'):
+            return 'utf-8', 'utf-8'
+
+        directory = filename and os.path.dirname(filename)
+        encoding = self.cache.get(directory)
+        if encoding and self.can_decode(html, encoding):
+            return encoding, 'cache'
+
+        # Run chardet on the part of the document starting shortly before the first non-ASCII byte
+        offset = max(0, first_non_ascii.start() - 1024)
+        res = chardet.detect(html[offset:offset + self.chardet_size])
+        encoding = res.get('encoding')
+        if encoding and directory is not None and res.get('confidence', 0) >= CACHE_CONFIDENCE:
+            self.cache[directory] = encoding
+        return encoding, 'chardet'
+
+    @staticmethod
+    def is_known(encoding):
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            return False
+        return True
+
+    @staticmethod
+    def can_decode(html, encoding):
+        try:
+            html.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            return False
+        return True
+
+    def pop_stats(self):
+        """Return detection statistics collected so far and reset them"""
+        stats = self.stats
+        self.stats = dict()
+        return stats
+
+    def merge_stats(self, stats):
+        """Add detection statistics collected by another detector (e.g., in a worker process)"""
+        for key, (count, seconds) in stats.items():
+            if key not in self.stats:
+                self.stats[key] = [0, 0.0]
+            self.stats[key][0] += count
+            self.stats[key][1] += seconds
+
+    def report(self):
+        """Return a human-readable summary of detection statistics"""
+
+        by_method = dict()
+        for (method, encoding), (count, seconds) in self.stats.items():
+            if method not in by_method:
+                by_method[method] = [0, 0.0, []]
+            by_method[method][0] += count
+            by_method[method][1] += seconds
+            by_method[method][2].append((count, encoding))
+
+        lines = ['Encoding detection:']
+        for method in ['bom', 'meta', 'ascii', 'utf-8', 'cache', 'chardet']:
+            if method not in by_method:
+                continue
+            count, seconds, encodings = by_method[method]
+            encodings = ', '.join(['%s: %d' % (encoding, n) for n, encoding in sorted(encodings, reverse=True)])
+            lines.append('    %-8s %6d documents, %8.3f s  (%s)' % (method, count, seconds, encodings))
+        return '\n'.join(lines)
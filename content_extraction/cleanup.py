@@ -1,29 +1,122 @@
 """HTML page cleanup: model learner and page cleaner"""
 
-import sys
+import os, sys
 import re
+import random
 from datetime import datetime, date
-#import hashlib
+import hashlib
 import cPickle
-import copy
+import struct
+import tempfile
+import multiprocessing
+from array import array
 
 from BeautifulSoup import NavigableString, Tag
 
-from content_extraction.extractor import Extractor
+from content_extraction.extractor import Extractor, walk_tree, EXTRACT, REMOVED_TAGS, REMOVED_TEXTS
+from content_extraction.counting import DIGEST_SIZE, TextDigestCounts, CountMinSketch, SketchedTextCounts
+from content_extraction.models import dump_binary_model, load_cleanup_model, CleanupModelRegistry, model_version, \
+                                      BinaryCleanupModel, TEMPLATE_SEPARATOR, TEMPLATES_KEY
+
+
+# Version of the format of files written by CleanupModelLearner.dump_counts()
+COUNTS_FORMAT_VERSION = 1
+
+# Hexadecimal strings in ids of elements (e.g., post ids), replaced by '1' in paths
+HEX_ID = re.compile(r'(?i)[\da-z]*\d[\da-z]*')
+
+# Trie of the elements without any paths of the cleanup model
+NO_PATHS = {}
+
+# Key of the tries of per-template models in the root of a compiled model (see PageCleaner.compile_model())
+TEMPLATE_TRIES = ('templates',)
 
 
 class CleanupModelLearner(Extractor):
     """Class that learns a model for cleaning up the content of files"""
 
-    def __init__(self, max_duplicates=2, **kwargs):
+    # Order in which input files are sampled (see __init__()); not set by PageCleaner
+    sample = None
+
+    def __init__(self, max_duplicates=2, compact=False, sketch_memory=None, sketch_depth=4, sketch_precision=10, templates=False, min_template_pages=10, sample=None, tolerance=0.01, check_interval=200, stable_checks=3, seed=None, **kwargs):
         """Initialize cleanup model learner.
         
         Takes standard options of Extractor, plus:
-         - max_duplicates: maximum number of (near) identical documents in the set
+         - max_duplicates: maximum number of (near) identical documents in the set; with the
+           near_duplicates option of Extractor, near-duplicate documents are not counted at all
+         - compact: whether to keep counts of text digests in arrays rather than texts in dictionaries,
+           which takes much less memory (digests are 64 bits: collisions are very unlikely)
+         - sketch_memory: if given, learn an approximate model in bounded memory: counts of texts 
+           are kept in a count-min sketch of this size (in megabytes), see below
+         - sketch_depth: number of rows of the count-min sketch (default: 4)
+         - sketch_precision: each path takes 2 * 2 ** sketch_precision bytes (default: 10, i.e. 2 KB) 
+         - templates: whether to also learn a model for each filename template (see filename_template()),
+           e.g. one for topics and one for profiles of a forum, in addition to the model of all files
+         - min_template_pages: minimum number of files of a template for its model to be kept 
+           (default: 10); files of other templates are cleaned with the model of all files
+         - sample: if given, learn from input files in a random order ('random'), or in a random
+           order where templates of file names are represented in proportion at any point 
+           ('stratified'), until the model converges: see below
+         - tolerance: mean absolute change of the scores of paths between two checks of a 
+           converged model, when sampling (default: 0.01)
+         - check_interval: number of files learned from between checks of convergence (default: 200)
+         - stable_checks: number of consecutive checks with changes within tolerance for the model
+           to be converged (default: 3)
+         - seed: seed of the random order of files, when sampling (default: random)
+
+        With a sketch of depth d and w = sketch_memory * 2**20 / (4 * d) counters per row, the 
+        number of documents containing a text at a path is never underestimated, and is 
+        overestimated by more than e * N / w (N: total number of counted texts in all documents)
+        with probability at most exp(-d). The numbers of distinct texts and of texts repeated in
+        more than max_duplicates documents at each path are estimated with a standard error of
+        1.04 / sqrt(2 ** sketch_precision) (3% by default).
+
+        Paths of per-template models are those of the model of all files, prefixed with the 
+        template and TEMPLATE_SEPARATOR, and the model has the path TEMPLATES_KEY; their texts are
+        counted separately (which takes twice as much memory). Templates are made of file names relative to the input directories: learn
+        the model from the same directories as are cleaned.
+
+        When sampling, the model (as returned by get_model()) is computed every check_interval 
+        files; learning stops when the scores of paths (those of either model; a missing path has
+        score 0) changed on average by at most tolerance since the previous check, at 
+        stable_checks consecutive checks (a single small change can be a lull between rare
+        templates). All input files are listed first (archives are sampled as a whole); files
+        are learned from in the main process, even with jobs > 1. See sampling_report().
+
+        With jobs > 1, each worker process learns counts from a part of the input files, and
+        the counts are merged (see dump_counts() and merge_counts()); approximate counts cannot
+        be merged, so with sketch_memory all files are processed in the main process.
         """
         
         Extractor.__init__(self, **kwargs)
-        self.max_duplicates = max_duplicates
+        self.max_duplicates = int(max_duplicates)
+        self.compact = compact or bool(sketch_memory)
+
+        self.sketch = None
+        if sketch_memory:
+            sketch_depth = int(sketch_depth)
+            width = int(float(sketch_memory) * 2**20 / (4 * sketch_depth))
+            self.sketch = CountMinSketch(width, sketch_depth)
+        self.sketch_precision = int(sketch_precision)
+
+        self.templates = templates
+        self.min_template_pages = int(min_template_pages)
+        assert not (templates and self.sketch), "per-template models cannot be learned with approximate counts"
+
+        assert sample in (None, 'random', 'stratified'), "unknown sampling order " + str(sample)
+        self.sample = sample
+        self.tolerance = float(tolerance)
+        self.check_interval = int(check_interval)
+        self.stable_checks = max(int(stable_checks), 1)
+        self.random = random.Random(seed)
+
+        ## when sampling: number of input files, files learned from, whether the model converged,
+        ## and the mean change of scores at each check: list of (files learned from, change)
+        self.total_files = 0
+        self.learned_files = 0
+        self.converged = False
+        self.changes = []
+        self.last_model = None
         
         ## dictionary of HTML elements (paths and content) with counts 
         self.elements = dict()
@@ -31,6 +124,21 @@ class CleanupModelLearner(Extractor):
 
 
     def add_to_model(self, elements):
+        if self.sketch:
+            for path in elements:
+                if path not in self.elements:
+                    self.elements[path] = SketchedTextCounts(self.text_signature(path), self.sketch, 
+                                                             self.max_duplicates, self.sketch_precision)
+                self.elements[path].add(elements[path])
+            return
+
+        if self.compact:
+            for path in elements:
+                if path not in self.elements:
+                    self.elements[path] = TextDigestCounts()
+                self.elements[path].add(elements[path])
+            return
+
         for path in elements:
             if path not in self.elements:
                 self.elements[path] = elements[path]
@@ -48,34 +156,192 @@ class CleanupModelLearner(Extractor):
 
         - format='python': returns the model as a python dictionary (default)
         - format='pickle': returns the model compressed with cPickle (i.e., a string)
+        - format='binary': returns the model in the binary format that can be memory-mapped 
+          when loaded (a string, see models.py)
         """
 
+        # Numbers of files of templates are counted at the path of the template without a path
+        template_pages = dict()
+        for path in self.elements.keys():
+            if path.endswith(TEMPLATE_SEPARATOR):
+                template_pages[path[:-1]] = sum(self.elements[path].values())
+        templated = self.templates or bool(template_pages)
+
         model = dict()
+        if templated:
+            model[TEMPLATES_KEY] = 0.0
         for path in self.elements.keys():
-             counts = [self.elements[path][text] for text in self.elements[path]]
-             repeated_cnt = len([x for x in counts if x > self.max_duplicates])
+             if templated and TEMPLATE_SEPARATOR in path:
+                 template, template_path = path.split(TEMPLATE_SEPARATOR, 1)
+                 if not template_path or template_pages.get(template, 0) < self.min_template_pages:
+                     continue
+             repeated_cnt, distinct_cnt = self.count_texts(path)
              if repeated_cnt:
-                model[path] = 1.0 * repeated_cnt / len(counts)
+                model[path] = 1.0 * repeated_cnt / distinct_cnt
         
         if format == 'pickle':        
             return cPickle.dumps(model, -1)
+        elif format == 'binary':
+            return dump_binary_model(model)
         else:    
             return model
         
+    def dump_counts(self, output):
+        """Write counts of texts collected so far to a file descriptor, to be merged later with merge_counts().
+
+        The format is a header line "cleanup-counts <version> <texts|digests> <digest size> <byte order>",
+        followed by one record per path: path length (in bytes) and number of texts (two 32-bit
+        integers, little-endian), the path in UTF-8, and arrays of the texts (digests, or lengths
+        of texts) and of their counts, followed by the texts in UTF-8.
+        """
+
+        assert not self.sketch, "approximate counts cannot be dumped and merged"
+
+        kind = self.compact and 'digests' or 'texts'
+        print >>output, "cleanup-counts %d %s %d %s" % (COUNTS_FORMAT_VERSION, kind, DIGEST_SIZE, sys.byteorder)
+        for path in self.elements:
+            encoded_path = path.encode("utf-8")
+            if self.compact:
+                counts = self.elements[path]
+                counts.merge()
+                output.write(struct.pack('<II', len(encoded_path), len(counts.digests)))
+                output.write(encoded_path)
+                output.write(counts.digests.tostring())
+                output.write(counts.counts.tostring())
+            else:
+                texts = [text.encode("utf-8") for text in self.elements[path]]
+                counts = array('I', self.elements[path].values())
+                output.write(struct.pack('<II', len(encoded_path), len(texts)))
+                output.write(encoded_path)
+                output.write(array('I', [len(text) for text in texts]).tostring())
+                output.write(counts.tostring())
+                output.write(''.join(texts))
+
+    def merge_counts(self, input):
+        """Add counts of texts read from a file descriptor (written by dump_counts()) to the counts of this learner"""
+
+        assert not self.sketch, "approximate counts cannot be dumped and merged"
+
+        header = input.readline().split()
+        assert header[:2] == ['cleanup-counts', str(COUNTS_FORMAT_VERSION)], "not a file with cleanup counts"
+        kind, digest_size, byteorder = header[2], int(header[3]), header[4]
+        assert kind == 'texts' or (self.compact and digest_size == DIGEST_SIZE), \
+               "counts of text digests can only be merged by a compact learner with the same digest size"
+
+        def read_array(typecode, length):
+            values = array(typecode)
+            values.fromstring(input.read(length * values.itemsize))
+            if byteorder != sys.byteorder:
+                values.byteswap()
+            return values
+
+        while True:
+            record = input.read(8)
+            if not record:
+                break
+            path_length, length = struct.unpack('<II', record)
+            path = input.read(path_length).decode("utf-8")
+            if kind == 'digests':
+                digests = read_array('L', length)
+                counts = read_array('I', length)
+            else:
+                text_lengths = read_array('I', length)
+                counts = read_array('I', length)
+                texts = []
+                for text_length in text_lengths:
+                    texts.append(input.read(text_length).decode("utf-8"))
+                if self.compact:
+                    pairs = sorted(zip([self.text_signature(text) for text in texts], counts))
+                    digests = array('L', [digest for digest, count in pairs])
+                    counts = array('I', [count for digest, count in pairs])
+
+            if self.compact:
+                if path not in self.elements:
+                    self.elements[path] = TextDigestCounts()
+                self.elements[path].add_counts(digests, counts)
+            else:
+                if path not in self.elements:
+                    self.elements[path] = dict()
+                path_counts = self.elements[path]
+                for text, count in zip(texts, counts):
+                    path_counts[text] = path_counts.get(text, 0) + count
+
+    def _extract_from_files_parallel(self, files):
+        """Learn counts from parts of the files in worker processes, and merge them"""
+
+        if self.sketch or self.sample:
+            for task in self._iter_tasks(files):
+                yield task[0], self._extract_from_prepared_file(*task)
+            return
+
+        # Archives are read by the workers, as other files; relative file names are given with
+        # file names, for templates
+        input_files = list(self._iter_input_files(files))
+
+        # Workers are forked: make sure buffered output is not written twice
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        workers = []
+        for i in range(self.jobs):
+            fd, counts_filename = tempfile.mkstemp(suffix='.counts')
+            os.close(fd)
+            worker = multiprocessing.Process(target=self._learn_from_files, args=(input_files[i::self.jobs], counts_filename))
+            worker.start()
+            workers.append((worker, counts_filename))
+
+        try:
+            for worker, counts_filename in workers:
+                worker.join()
+                assert worker.exitcode == 0, "learning failed in a worker process"
+                f = open(counts_filename, 'rb')
+                self.merge_counts(f)
+                f.close()
+        finally:
+            for worker, counts_filename in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                os.remove(counts_filename)
+
+    def _learn_from_files(self, input_files, counts_filename):
+        """Learn counts from files ((filename, relative_filename) pairs) and dump them to a file
+        (in a worker process)"""
+
+        self.elements = dict()
+        for filename, relative_filename, html in self._iter_documents(input_files):
+            task = self._prepare_file(filename, relative_filename, html)
+            if task is not None:
+                self._extract_from_prepared_file(*task)
+        f = open(counts_filename, 'wb')
+        self.dump_counts(f)
+        f.close()
+
+    def count_texts(self, path):
+        """Return the number of texts found at a path in more than max_duplicates documents, and the number of distinct texts"""
+
+        if self.sketch:
+            return self.elements[path].estimate()
+        counts = self.elements[path].values()
+        return len([x for x in counts if x > self.max_duplicates]), len(counts)
+
     def load_model(self, model):    
         """Load a cleanup model: 'model' is a filename or output of get_model"""
 
         if isinstance(model, basestring):
-            #self.skip_paths = cPickle.load(open(model_file))
-            self.skip_paths = eval(open(model).read())
+            self.skip_paths = load_cleanup_model(model)
         else:
             self.skip_paths = model    
         
     def signature(self, path, string = ''):
         s = path + string
-        #return str(len(s)) + ':' + hashlib.sha1(s.encode("utf-8")).digest()
         return s
 
+    def text_signature(self, string):
+        """Signature of a text: the text itself, or its digest (an integer) in compact mode"""
+        if self.compact:
+            return int(hashlib.md5(string.encode("utf-8")).hexdigest()[:2 * DIGEST_SIZE], 16)
+        return self.signature('', string)
+
 
     def filename_template(self, filename):
         res = re.sub('!', '', filename, re.UNICODE)
@@ -84,17 +350,85 @@ class CleanupModelLearner(Extractor):
         res = re.sub('!', '1', res, re.UNICODE)
         return res
 
+    def cleanup_soup(self, soup):
+        # Scripts, styles, iframes and comments are removed by extract_from_soup(), in the
+        # same walk of the tree as texts are visited
+        return 0
+
     def extract_from_soup(self, soup, filename, relative_filename):
         self.local_elements = dict()
-        self.walk_elements(soup, '/')
+        self.visited_nodes = self.walk_elements(soup, '/')
+        if self.templates:
+            prefix = self.filename_template(relative_filename or filename or '') + TEMPLATE_SEPARATOR
+            for path, texts in self.local_elements.items():
+                self.local_elements[prefix + path] = dict(texts)
+            self.local_elements[prefix] = {self.text_signature(u''): 1}
         self.add_to_model(self.local_elements)
         self.local_elements = None
+        if self.sample:
+            self.learned_files += 1
+            if self.learned_files % self.check_interval == 0:
+                self.check_convergence()
+
+    def _iter_input_files(self, files):
+        """Generate input files in the sampling order, if sampling, until the model converges"""
+
+        if not self.sample:
+            for filename, relative_filename in Extractor._iter_input_files(self, files):
+                yield filename, relative_filename
+            return
+
+        input_files = list(Extractor._iter_input_files(self, files))
+        self.total_files = len(input_files)
+        if self.sample == 'stratified':
+            # Files of each template are shuffled and spread evenly over the order
+            templates = dict()
+            for input_file in input_files:
+                templates.setdefault(self.filename_template(input_file[1]), []).append(input_file)
+            keyed = []
+            for template_files in templates.values():
+                self.random.shuffle(template_files)
+                for i, input_file in enumerate(template_files):
+                    keyed.append(((i + self.random.random()) / len(template_files), input_file))
+            keyed.sort()
+            input_files = [input_file for key, input_file in keyed]
+        else:
+            self.random.shuffle(input_files)
+
+        for input_file in input_files:
+            if self.converged:
+                break
+            yield input_file
+
+    def check_convergence(self):
+        """Compute the model and compare it with the model of the previous check"""
+
+        model = self.get_model()
+        if self.last_model is not None:
+            changes = [abs(score - self.last_model.get(path, 0.0)) for path, score in model.iteritems()] + \
+                      [score for path, score in self.last_model.iteritems() if path not in model]
+            change = sum(changes) / max(len(changes), 1)
+            self.changes.append((self.learned_files, change))
+            self.log("Learned from", self.learned_files, "files: mean change of scores", "%.4f" % change)
+            recent = [change for files, change in self.changes[-self.stable_checks:]]
+            self.converged = len(recent) == self.stable_checks and max(recent) <= self.tolerance
+        self.last_model = model
+
+    def sampling_report(self):
+        """Return a text report of sampling: files learned from, out of all files, and convergence"""
+
+        lines = ["Learned from %d of %d files (%.1f%%), %s order: %s" %
+                 (self.learned_files, self.total_files, 100.0 * self.learned_files / max(self.total_files, 1),
+                  self.sample, self.converged and "converged" or "not converged")]
+        for files, change in self.changes:
+            lines.append("    %8d files: mean change of scores %.4f" % (files, change))
+        return '\n'.join(lines)
   
     def visit_leaf_element(self, node, path):
         node_string = self.clean_string(node.string)
         if node_string:
             path_signature = self.signature(path)
-            text_signature = self.signature('', node_string)
+            text_signature = self.text_signature(node_string)
             #print >>sys.stderr, path_signature, text_signature.encode("utf-8")
             if path_signature in self.local_elements:
                 self.local_elements[path_signature][text_signature] = 1
@@ -102,24 +436,38 @@ class CleanupModelLearner(Extractor):
                 self.local_elements[path_signature] = {text_signature: 1}
         
     def walk_elements(self, soup, path = '/'):
-        content = ''
-        count = 0
-        for node in soup.contents:
-            count += 1
-
-            if isinstance(node, NavigableString):
-                self.visit_leaf_element(node, path + "@" + str(count))
-            elif isinstance(node, Tag):
-                attrs = ''
-                if node.get('class'):
-                    attrs += '.' + node['class']
-                if node.get('id'):
-                    # Remove all hex. strings from id
-                    node_id = re.sub(r'(?i)[\da-z]*\d[\da-z]*', '1', node['id'])
-                    attrs += '#' + node_id
-  
-                sub_path = path + node.name + attrs + '/'
-                self.walk_elements(node, sub_path)
+        """Visit all texts with their paths, removing scripts, styles, iframes and comments;
+        return the number of nodes visited"""
+        return walk_tree(soup, path, self.enter_element, self.visit_text)
+
+    def path_component(self, node):
+        """Path component of an element: name, class and id (with hex. strings replaced)"""
+        # Attributes are read from the list: the first Tag.get() of an element searches all its
+        # descendants (for a tag named 'attrMap'), which is quadratic on deeply nested pages
+        node_class = node_id = None
+        for name, value in node.attrs:
+            if name == 'class':
+                node_class = value
+            elif name == 'id':
+                node_id = value
+
+        component = node.name
+        if node_class:
+            component += '.' + node_class
+        if node_id:
+            # Remove all hex. strings from id
+            component += '#' + HEX_ID.sub('1', node_id)
+        return component
+
+    def enter_element(self, node, number, path):
+        if node.name in REMOVED_TAGS:
+            return EXTRACT
+        return path + self.path_component(node) + '/'
+
+    def visit_text(self, node, number, path):
+        if isinstance(node, REMOVED_TEXTS):
+            return EXTRACT
+        self.visit_leaf_element(node, path + "@" + str(number))
 
 
         
@@ -127,62 +475,151 @@ class CleanupModelLearner(Extractor):
 class PageCleaner(CleanupModelLearner):
     """Clean web pages based on a previously learned model"""
 
-    def __init__(self, cleanup_model=None, cleanup_threshold=0.1, **kwargs):
+    def __init__(self, cleanup_model=None, cleanup_threshold=0.1, model_registry=None, model_memory=1024, **kwargs):
         """Initialize cleanup model learner.
         
         Takes standard parameters of Extractor, plus:
          - cleanup_model: filename of the model to load, or model itself
          - cleanup_threshold: 0 means less conservative, 1 means more conservative
+         - model_registry: models of several sites (see models.CleanupModelRegistry): a file name, a
+           dictionary or a registry; files without a model in the registry are cleaned with
+           cleanup_model, if given, or only stripped of empty elements
+         - model_memory: memory limit for models loaded from the registry, in megabytes (default: 1024)
         """
        
         Extractor.__init__(self, **kwargs)
         self.cleanup_model = cleanup_model
         self.cleanup_threshold = cleanup_threshold
         
-        assert self.cleanup_model, "PageCleaner extractor requires a cleanup model"
+        assert self.cleanup_model or model_registry, "PageCleaner extractor requires a cleanup model"
+
+        self.model_registry = model_registry
+        if model_registry is not None and not isinstance(model_registry, CleanupModelRegistry):
+            self.model_registry = CleanupModelRegistry(model_registry, float(model_memory) * 2**20,
+                                                       compile=self.compile_model, quiet=self.quiet)
        
-        self.load_model(self.cleanup_model)
+        self.default_trie = dict()
+        if self.cleanup_model:
+            self.load_model(self.cleanup_model)
+            self.default_trie = self.compile_model(self.skip_paths)
+        self.trie = self.default_trie
+
+        ## versions of cleanup models (see extraction_version()), by file name or id of the model
+        self.model_versions = dict()
+
+    def compile_model(self, model):
+        """Compile a cleanup model to a trie of path components.
+
+        Only paths of texts to be removed (with scores above the threshold) are kept. Inner nodes
+        of the trie are dictionaries: path component of an element -> trie node; number of a text 
+        (an integer) -> score of the text. Per-template models (see CleanupModelLearner) are 
+        compiled to tries in a dictionary at the root of the trie: TEMPLATE_TRIES -> template -> trie.
+
+        Binary models (except those of version 1) contain the trie: it is used as it is, read from 
+        the memory-mapped file as needed (see models.BinaryTrieNode).
+        """
+        if isinstance(model, BinaryCleanupModel):
+            trie = model.trie(self.cleanup_threshold)
+            if trie is not None:
+                return trie
+
+        trie = dict()
+        templated = TEMPLATES_KEY in model
+        for path, score in model.iteritems():
+            if score > self.cleanup_threshold and not (templated and path == TEMPLATES_KEY):
+                node = trie
+                if templated and TEMPLATE_SEPARATOR in path:
+                    template, path = path.split(TEMPLATE_SEPARATOR, 1)
+                    node = trie.setdefault(TEMPLATE_TRIES, {}).setdefault(template, {})
+                components = path.split('/')
+                for component in components[1:-1]:
+                    node = node.setdefault(component, {})
+                # Paths of texts always end with /@<number>
+                node[int(components[-1][1:])] = score
+        return trie
+
+    def extraction_version(self, filename=None):
+        """Add the version of the cleanup model used for a file and the threshold to the version of the extractor"""
+
+        model = None
+        if self.model_registry is not None:
+            model = self.model_registry.get_source(filename)
+        if model is None:
+            model = self.cleanup_model
+        key = isinstance(model, basestring) and model or id(model)
+        if key not in self.model_versions:
+            self.model_versions[key] = model and model_version(model) or 'none'
+        return '%s-%s-%s' % (Extractor.extraction_version(self, filename), self.model_versions[key], self.cleanup_threshold)
+
+    def _extract_from_files_parallel(self, files):
+        # Pages are cleaned independently of each other: use the pool of workers of Extractor
+        return Extractor._extract_from_files_parallel(self, files)
 
     def remove_empty_elements(self, root):
-        nodes = copy.copy(root.contents)
-        for node in nodes:
-            if isinstance(node, NavigableString):
-                # Remove empty (or rather, whitespace-only) strings
-                if not self.clean_string(node.string):
-                    node.extract()
-            elif isinstance(node, Tag):
-                # Clean the node recursively
-                self.remove_empty_elements(node)
-                # Keep <br/> and <hr/> elements
-                if node.name not in ('br', 'hr'):
-                    # Remove nodes without any content 
-                    has_child_with_content = False
-                    for child  in node.contents:
-                         if isinstance(child, NavigableString) \
-                            or (isinstance(child, Tag) and child.name not in ('br', 'hr')):
-                            has_child_with_content = True
-                            break
-                    if not has_child_with_content:
-                        node.extract()
+        walk_tree(root, True, None, self._remove_empty_text, self._remove_empty_element)
+
+    def _remove_empty_text(self, node, number, state):
+        # Remove empty (or rather, whitespace-only) strings
+        return not self.clean_string(node.string)
+
+    def _remove_empty_element(self, node):
+        # Keep <br/> and <hr/> elements
+        if node.name not in ('br', 'hr'):
+            # Remove nodes without any content (children were cleaned already)
+            for child in node.contents:
+                if isinstance(child, NavigableString) \
+                   or (isinstance(child, Tag) and child.name not in ('br', 'hr')):
+                    return False
+            return True
+        return False
 
     def extract_from_soup(self, soup, filename, relative_filename):
-        self.nodes_to_remove = []
-        
-        self.walk_elements(soup, '/')
-        
-        for node in self.nodes_to_remove:
-            node.extract()
-            
-        self.remove_empty_elements(soup)
-                
+        if self.model_registry:
+            trie = self.model_registry.get_model(filename)
+            # An empty model of a site (removing nothing) is used as any other
+            self.trie = self.default_trie if trie is None else trie
+
+        trie = self.trie
+        if isinstance(trie, dict):
+            templates = trie.get(TEMPLATE_TRIES)
+        else:
+            templates = trie.templates
+        if templates:
+            # Model of the template of the file, if there is one
+            trie = templates.get(self.filename_template(relative_filename or filename or ''), trie)
+
+        # Remove scripts, styles, iframes, comments, texts matched by the model and then empty 
+        # elements, all in one walk of the tree
+        self.visited_nodes = walk_tree(soup, trie, self._enter_element_to_clean, 
+                                       self._visit_text_to_clean, self._remove_empty_element)
         return soup  
-        
-    def visit_leaf_element(self, node, path):
-        node_string = self.clean_string(node.string)
-        if node_string:
-            signature = self.signature(path)
-            if signature in self.skip_paths and self.skip_paths[signature] > self.cleanup_threshold:
-                self.nodes_to_remove.append(node)
+
+    def _enter_element_to_clean(self, node, number, trie):
+        """Descend the trie of the model along with the elements (see compile_model()).
+
+        Same paths as in walk_elements(), but no path strings are built; below elements without
+        any paths in the trie, only scripts etc. and empty elements are removed.
+        """
+        if node.name in REMOVED_TAGS:
+            return EXTRACT
+        if not trie:
+            return trie
+
+        component = self.path_component(node)
+        if '/' in component:
+            # Class or id with slashes: one component per part, as in a split path
+            for part in component.split('/'):
+                trie = trie.get(part)
+                if trie is None:
+                    return NO_PATHS
+            return trie
+        return trie.get(component, NO_PATHS)
+
+    def _visit_text_to_clean(self, node, number, trie):
+        if isinstance(node, REMOVED_TEXTS):
+            return EXTRACT
+        # Remove texts matched by the model and empty (or rather, whitespace-only) texts
+        return number in trie or not self.clean_string(node.string)
 
         
 
@@ -0,0 +1,149 @@
+"""Compact and approximate counting of texts for cleanup model learning"""
+
+import math
+import bisect
+import itertools
+from array import array
+
+
+# Size of text digests used by compact cleanup model learning: the size of an array('L') item
+DIGEST_SIZE = array('L').itemsize
+DIGEST_BITS = 8 * DIGEST_SIZE
+
+# Minimal number of buffered digests before they are merged into sorted arrays
+DIGEST_BUFFER_SIZE = 1024
+
+
+class TextDigestCounts:
+    """Compact counts of texts (given as integer digests) found at one path.
+
+    Digests are appended to a buffer; when the buffer grows as large as the set of counted
+    digests, it is merged into two arrays: sorted distinct digests and their counts.
+    """
+
+    def __init__(self):
+        self.digests = array('L')
+        self.counts = array('I')
+        self.buffer = array('L')
+
+    def add(self, digests):
+        """Count each of the given digests once"""
+        self.buffer.extend(digests)
+        if len(self.buffer) >= max(DIGEST_BUFFER_SIZE, len(self.digests)):
+            self.merge()
+
+    def merge(self):
+        """Merge buffered digests into the sorted arrays"""
+        if not self.buffer:
+            return
+        digests, counts = array('L'), array('I')
+        for digest, group in itertools.groupby(sorted(self.buffer)):
+            digests.append(digest)
+            counts.append(len(list(group)))
+        self.buffer = array('L')
+        self.add_counts(digests, counts)
+
+    def add_counts(self, new_digests, new_counts):
+        """Add counts of distinct digests, given as arrays sorted by digest"""
+        old_digests, old_counts = self.digests, self.counts
+        digests, counts = array('L'), array('I')
+        i = 0
+        for digest, count in itertools.izip(new_digests, new_counts):
+            j = bisect.bisect_left(old_digests, digest, i)
+            digests.extend(old_digests[i:j])
+            counts.extend(old_counts[i:j])
+            i = j
+            if i < len(old_digests) and old_digests[i] == digest:
+                count += old_counts[i]
+                i += 1
+            digests.append(digest)
+            counts.append(count)
+        digests.extend(old_digests[i:])
+        counts.extend(old_counts[i:])
+        self.digests, self.counts = digests, counts
+
+    def values(self):
+        """Return counts of all distinct digests"""
+        self.merge()
+        return self.counts
+
+
+class CountMinSketch:
+    """Count-min sketch of integer keys (Cormode and Muthukrishnan, 2005).
+
+    Estimated counts are never lower than the true counts. With width w and depth d, an 
+    estimate exceeds the true count by more than e * N / w (N is the sum of all counts) 
+    with probability at most exp(-d).
+    """
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', [0]) * width for i in xrange(depth)]
+
+    def add(self, key):
+        """Increment the count of a key (a digest); return its new estimated count"""
+        # Row indexes by double hashing of the two halves of the key
+        h1, h2 = key & ((1 << (DIGEST_BITS / 2)) - 1), (key >> (DIGEST_BITS / 2)) | 1
+        estimate = None
+        for i, row in enumerate(self.rows):
+            j = (h1 + i * h2) % self.width
+            row[j] += 1
+            if estimate is None or row[j] < estimate:
+                estimate = row[j]
+        return estimate
+
+
+class HyperLogLog:
+    """Estimator of the number of distinct keys (digests) (Flajolet et al., 2007).
+
+    With 2 ** precision one-byte registers, the standard error of the estimate is
+    1.04 / sqrt(2 ** precision); small counts are estimated by linear counting.
+    """
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.registers = array('B', [0]) * (1 << precision)
+
+    def add(self, key):
+        index = key >> (DIGEST_BITS - self.precision)
+        rest = key & ((1 << (DIGEST_BITS - self.precision)) - 1)
+        rank = DIGEST_BITS - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(1.0 * m / zeros)
+        return estimate
+
+
+class SketchedTextCounts:
+    """Approximate counts of texts (given as integer digests) found at one path.
+
+    Counts of (path, text) pairs are kept in a count-min sketch shared by all paths. For the 
+    path itself, only the number of distinct texts and the number of texts seen more than
+    max_duplicates times are estimated, with two HyperLogLog estimators.
+    """
+
+    def __init__(self, path_digest, sketch, max_duplicates, precision):
+        self.path_digest = path_digest
+        self.sketch = sketch
+        self.max_duplicates = max_duplicates
+        self.distinct = HyperLogLog(precision)
+        self.repeated = HyperLogLog(precision)
+
+    def add(self, digests):
+        """Count each of the given digests once"""
+        for digest in digests:
+            self.distinct.add(digest)
+            if self.sketch.add(digest ^ self.path_digest) > self.max_duplicates:
+                self.repeated.add(digest)
+
+    def estimate(self):
+        """Return estimated numbers of repeated texts and of distinct texts"""
+        distinct = self.distinct.count()
+        return min(self.repeated.count(), distinct), distinct
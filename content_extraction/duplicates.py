@@ -0,0 +1,108 @@
+"""Detection of near-duplicate pages (print views, URL variants with session ids...)
+
+Pages are compared by SimHash fingerprints (Charikar): 64-bit fingerprints of the set of
+shingles (sequences of SHINGLE_SIZE consecutive words) of their text, such that the number of
+bits in which the fingerprints of two pages differ grows as the pages get less similar. Two
+pages are near-duplicates if their fingerprints differ in at most (1 - similarity) * 64 bits.
+
+NearDuplicateIndex keeps the fingerprints of the pages seen so far. To find fingerprints within
+distance d without comparing with all of them, fingerprints are split in d + 1 blocks of bits:
+a fingerprint within distance d is equal to the new one in at least one block, so only
+fingerprints sharing a block with it are compared.
+"""
+
+import re
+import hashlib
+
+FINGERPRINT_BITS = 64
+
+# Number of words in a shingle
+SHINGLE_SIZE = 4
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# For each bit of a byte, the bytes where it is not set
+BYTES_WITHOUT_BIT = [''.join([chr(value) for value in xrange(256) if not value & (1 << bit)]) for bit in xrange(8)]
+
+
+def simhash(text, shingle_size=SHINGLE_SIZE):
+    """Return the 64-bit SimHash fingerprint of a text (a string or unicode), or None if it has no words"""
+
+    if not isinstance(text, unicode):
+        text = text.decode("utf-8", "replace")
+    words = WORD.findall(text.lower())
+    if not words:
+        return None
+    shingles = set([u' '.join(words[i:i + shingle_size]).encode("utf-8")
+                    for i in xrange(max(len(words) - shingle_size + 1, 1))])
+
+    # Count the shingles whose hash has each bit set: the hashes are concatenated, and the bytes
+    # at each position without the bit are deleted, for all shingles at once
+    digests = ''.join([hashlib.md5(shingle).digest()[:8] for shingle in shingles])
+    half = len(shingles) / 2.0
+    fingerprint = 0
+    for position in xrange(8):
+        column = digests[position::8]
+        for bit in xrange(8):
+            if len(column.translate(None, BYTES_WITHOUT_BIT[bit])) > half:
+                fingerprint |= 1 << (8 * position + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    """Number of bits in which two fingerprints differ"""
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    """Index of fingerprints of pages, to find near-duplicates of new pages"""
+
+    def __init__(self, similarity=0.95):
+        """Create an index where pages whose fingerprints agree in at least similarity * 64 bits
+        (0 < similarity <= 1) are near-duplicates"""
+
+        similarity = float(similarity)
+        assert 0 < similarity <= 1, "similarity must be between 0 and 1"
+        self.similarity = similarity
+        self.max_distance = int((1 - similarity) * FINGERPRINT_BITS + 1e-9)
+
+        # Blocks of bits: (shift, mask)
+        blocks = self.max_distance + 1
+        self.blocks = []
+        for i in xrange(blocks):
+            start, end = i * FINGERPRINT_BITS / blocks, (i + 1) * FINGERPRINT_BITS / blocks
+            self.blocks.append((start, (1 << (end - start)) - 1))
+
+        ## for each block: value of the block -> list of (fingerprint, page)
+        self.tables = [dict() for block in self.blocks]
+
+        self.pages = 0
+        self.duplicates = 0
+
+    def find(self, fingerprint):
+        """Return (page, distance) for an indexed page that is a near-duplicate of a fingerprint,
+        or None"""
+
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            for other, page in table.get((fingerprint >> shift) & mask, ()):
+                distance = hamming_distance(fingerprint, other)
+                if distance <= self.max_distance:
+                    return page, distance
+        return None
+
+    def add(self, page, text):
+        """Add a page (a name) with a given text to the index, unless it is a near-duplicate of
+        an indexed page; return (name of the indexed page, distance) if it is, None otherwise.
+        Pages without text are not indexed."""
+
+        fingerprint = simhash(text)
+        self.pages += 1
+        if fingerprint is None:
+            return None
+        duplicate = self.find(fingerprint)
+        if duplicate:
+            self.duplicates += 1
+            return duplicate
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, page))
+        return None
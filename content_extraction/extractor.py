@@ -2,13 +2,28 @@
 
 
 import os, sys, traceback
+import fnmatch
+import inspect
+import hashlib
+import codecs
 from BeautifulSoup import BeautifulSoup, BeautifulStoneSoup, PageElement, Tag, NavigableString, Comment, Declaration, ProcessingInstruction
 from datetime import datetime, date
-import xml.dom.minidom
-import subprocess
+import multiprocessing
+import threading
+import time
+import Queue
 import re
+import json
+from cStringIO import StringIO
 
-import chardet
+from content_extraction.charsets import EncodingDetector
+from content_extraction.parsers import get_parser
+from content_extraction.records import record_type, record_to_json, TableWriter, TABLE_FORMATS
+from content_extraction.sinks import Output, DirectorySink, TarSink
+from content_extraction.manifest import Manifest
+from content_extraction.sources import archive_type, iter_archive, document_path
+from content_extraction.instrumentation import Instrumentation, NullInstrumentation
+from content_extraction.duplicates import NearDuplicateIndex
 
 BLOCK_LEVEL_TAGS = set(['address', 'blockquote', 'center', 'dir', 'div', 'dl', 
                         'fieldset', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 
@@ -18,30 +33,122 @@ BLOCK_LEVEL_TAGS = set(['address', 'blockquote', 'center', 'dir', 'div', 'dl',
                         'br']) 
  
 
+# Patterns used by Extractor.clean_string()
+QUOTE_ENTITY = re.compile('(?i)&\w*quo\w*;')
+ENTITY = re.compile('(?i)&#*\w+;')
+SPACES = re.compile('\s+')
+IRREGULAR_SPACES = re.compile('[\t\n\r\f\v]|  ')
+NEWLINES = re.compile(r'\s*(-NEWLINE-\s*)+')
+SPACE_CHARS = ' \t\n\r\f\v'
+BLANK_LINES = re.compile(r"\n\s*\n\s*\n")
+
+# Number of leading bytes of a file that are examined to detect HTML
+HTML_SNIFF_SIZE = 4096
+
+# Markup that identifies HTML documents (the same signatures as used by the 'file' command)
+HTML_SIGNATURE = re.compile(r'(?i)<(!doctype\s+html|(html|head|title|body|script|style|table|frameset)[\s>]|a\s+href=)')
+
+# XML documents (feeds, SVG images) are HTML only if they are XHTML
+XML_START = re.compile(r'(?i)\s*<(\?xml|svg)')
+XHTML_SIGNATURE = re.compile(r'(?i)<(!doctype\s+html|html[\s>])')
+
+# Control characters that do not occur in text files
+BINARY_CHARS = re.compile('[\x00-\x06\x0e-\x1a\x1c-\x1f]')
+
+# Elements and texts removed by Extractor.cleanup_soup()
+REMOVED_TAGS = ('script', 'style', 'iframe')
+REMOVED_TEXTS = (Comment, Declaration, ProcessingInstruction)
+
+# Indentation of nested XML elements in the output
+XML_INDENT = u'    '
+
+# Returned by callbacks of walk_tree() to remove a node from the tree before it is counted
+EXTRACT = object()
+
+
 class Extractor:
     """Generic content extractor"""
 
-    def __init__(self, output_dir=None, output_format="xml", overwrite=False, flatten_files=False, encoding=None, **kwargs):
+    def __init__(self, output_dir=None, output_format="xml", overwrite=False, flatten_files=False, encoding=None, jobs=1, html_patterns=None, parser='beautifulsoup', prefetch=0, output_archive=None, manifest=None, instrument=False, stats=None, trace=None, quiet=False, near_duplicates=None, near_duplicates_list=None, **kwargs):
         """Initialize an extractor with given options.
         
         Available options:
          - output_dir: where to store the results
-         - output_format: 'xml', 'html', 'txt' or 'soup'
+         - output_archive: tar archive where to store the results, instead of output_dir (outputs
+           are appended to the archive, see sinks.py)
+         - output_format: 'xml', 'html', 'txt', 'soup', 'jsonl' (a JSON object per line for each record),
+           or 'csv' or 'parquet' (tables of records, one per record type, written to output_dir;
+           see records.py)
          - overwrite: whether to overwrite existing files
+         - manifest: file name of a manifest of processed files (see manifest.py); if given, only 
+           new or changed files (or files whose extraction_version() changed) are processed, and 
+           their outputs overwritten
          - flatten_files: whether to flatten directory/filename structure when saving files
+         - jobs: number of worker processes used to extract from files (default: 1, no workers)
+         - html_patterns: list of glob patterns (e.g. '*.htm*'); if given, only files with matching
+           names are checked for HTML content, other files are skipped
+         - parser: HTML parser, 'beautifulsoup' (default) or 'lxml' (see parsers.py)
+         - instrument: whether to record time, bytes and nodes by page and processing stage (see
+           instrumentation.py); implied by stats and trace
+         - stats: file where a JSON summary of the instrumentation is written at the end of extraction
+         - trace: file where records of all pages are written by the instrumentation, as JSON lines
+         - quiet: whether to turn off logging of processed files to STDERR (errors are still reported)
+         - prefetch: number of files read (and their encodings detected) ahead by a thread while
+           the current file is parsed (default: 0, no thread); not used with jobs > 1
+         - near_duplicates: similarity threshold (e.g. 0.95); if given, pages whose text is a 
+           near-duplicate of a page processed before are skipped (see duplicates.py). With 
+           jobs > 1, each worker process detects near-duplicates among the files it processes.
+         - near_duplicates_list: file where skipped near-duplicates are listed, with the pages 
+           they duplicate (tab-separated lines: page, original page, distance)
         """
 
         self.output_dir = output_dir
+        self.output_archive = output_archive
         self.output_format = output_format
         self.overwrite = overwrite
+        self.manifest_filename = manifest
         self.flatten_files = flatten_files
         self.encoding = encoding
+        self.jobs = int(jobs or 1)
+        self.prefetch = int(prefetch or 0)
+        self.html_patterns = html_patterns
+        self.encoding_detector = EncodingDetector()
+        self.parser = parser or 'beautifulsoup'
+        self.parse_html = get_parser(self.parser)
+        self.quiet = quiet
+        self.stats_filename = stats
+        self.instrumentation = NullInstrumentation()
+        if instrument or stats or trace:
+            self.instrumentation = Instrumentation(trace)
+
+        self.near_duplicates = None
+        if near_duplicates:
+            self.near_duplicates = NearDuplicateIndex(near_duplicates)
+        self.near_duplicates_list = near_duplicates_list
+        if near_duplicates_list:
+            # Truncated here, appended to by the main process or the workers
+            open(near_duplicates_list, 'w').close()
 
         self.last_file_id = 0
+
+        ## number of nodes visited by the last call of extract_from_soup(), if the extractor counts them
+        self.visited_nodes = None
         
         if self.output_dir and not os.path.isdir(self.output_dir):
            os.mkdir(self.output_dir)
 
+        assert self.output_format not in TABLE_FORMATS or self.output_dir, \
+               "output format %s requires an output directory" % self.output_format
+        self.table_writer = None
+        self.output_sink = None
+        self.manifest = None
+        self.code_version = None
+
+        ## fingerprints of files being processed, to be recorded in the manifest: file name -> fingerprint
+        self.changed_files = dict()
+        ## files whose outputs are buffered in the output sink, recorded in the manifest once written
+        self.saved_files = []
+
     def finish(self):
         """Finish the extraction; can be redefined in ancestors to perform something meaningful.
 
@@ -62,58 +169,119 @@ class Extractor:
         If 'output' is defined, returns None. Otherwise returns a list of extraction results 
         for all files/docs/soups. The order in the result list is the same as the order in
         the input docs/soups.
+
+        If the extractor was created with jobs > 1, files are processed by a pool of worker 
+        processes (the order of results is kept). Since extract_from_soup() is then called in
+        the workers, extractors that collect data across files for finish() should use jobs=1.
+
+        To process many documents without keeping all results in memory, use iter_extract().
         """
         
         results = []
 
+        if self.output_format in TABLE_FORMATS:
+            self.table_writer = TableWriter(self.output_dir, self.output_format, quiet=self.quiet)
+
         if output and self.output_format == 'xml':
                 print >>output, "<data>" 
 
+        for source, result in self._iter_results(files, htmls, soups, output):
+            self._process_result(result, output, results)
+
+        result = self.finish()
+        self._process_result(result, output, results)
+        self._finish_instrumentation()
+
+        if output and self.output_format == 'xml':
+                print >>output, "</data>" 
+
+        if self.table_writer:
+            self.table_writer.close()
+            self.table_writer = None
+
+        return results
+
+
+    def iter_extract(self, files=None, htmls=None, soups=None):
+        """Extract information from files or directories, HTML documents or soups (as extract()); 
+        generate results one by one, as they are produced.
+
+        Generates (source, result) pairs: the source is the file name for files, and the position
+        in the list for htmls and soups. Results are those returned by extract() without output
+        (in the output format); files that are saved to output_dir (or output_archive), skipped or 
+        not HTML generate nothing. The result of finish(), if not None, is generated last, with source None. Records
+        are not written to tables with table output formats.
+        """
+
+        for source, result in self._iter_results(files, htmls, soups):
+            yield source, result
+
+        result = self.finish()
+        self._finish_instrumentation()
+        if result is not None:
+            yield None, result
+
+
+    def _iter_results(self, files, htmls, soups, output=None):
+        """Generate (source, result) for all files/docs/soups, but not the result of finish()"""
+
         if htmls: 
-            for html in htmls:
-                result = self.extract_from_html(html=html)
-                self._process_result(result, output, results)
+            for i, html in enumerate(htmls):
+                yield i, self.extract_from_html(html=html)
         
         if soups: 
-            for soup in soups:
+            for i, soup in enumerate(soups):
                 self.cleanup_soup(soup)
-                result = self.extract_from_soup(soup, "", "")
-                self._process_result(result, output, results)
+                yield i, self.extract_from_soup(soup, "", "")
        
         if files: 
-            for dir_or_file in files:
-                dir_or_file = os.path.abspath(dir_or_file) 
-                
-                if os.path.isdir(dir_or_file):
-                    # input is a directory
-                    dir_name = dir_or_file
-                    for path, dirs, files in os.walk(dir_name):
-                        for file in files:
-                            filename = os.path.join(path, file)
-                            relative_filename = re.sub('^' + dir_name + '/*', '', filename)
-                            result = self.extract_from_file(filename, relative_filename)
-                            if result is not None:
-                                self._process_result(result, output, results)
-                else:
-                    # input is a file
-                    filename = dir_or_file
-                    assert os.path.exists(filename), filename + " does not exist"
-                    relative_filename = os.path.basename(filename)
-                    result = self.extract_from_file(filename, relative_filename)
+            if self.jobs > 1 and self.output_format != 'soup':
+                # Workers are forked: make sure buffered output is not written twice
+                if output:
+                    output.flush()
+                file_results = self._extract_from_files_parallel(files)
+            elif self.prefetch > 0:
+                file_results = ((task[0], self._extract_from_prepared_file(*task, document=document))
+                                for task, document in self._iter_prefetched_files(files))
+            else:
+                file_results = ((task[0], self._extract_from_prepared_file(*task))
+                                for task in self._iter_tasks(files))
+            try:
+                for filename, result in file_results:
+                    result = self._save_output(filename, result)
                     if result is not None:
-                        self._process_result(result, output, results)
+                        yield filename, result
+            finally:
+                self._close_output_sink()
+                self._close_manifest()
 
-        result = self.finish()
-        self._process_result(result, output, results)
 
-        if output and self.output_format == 'xml':
-                print >>output, "</data>" 
+    def _finish_instrumentation(self):
+        """Write the summary of the instrumentation, if requested, and close the trace"""
+
+        if self.stats_filename:
+            f = open(self.stats_filename, 'w')
+            json.dump(self.instrumentation.summary(), f, indent=2, sort_keys=True)
+            f.close()
+        self.instrumentation.close()
 
-        return results
+
+    def log(self, *args):
+        """Log a message (the arguments separated by spaces) to STDERR, unless quiet"""
+
+        if not self.quiet:
+            print >>sys.stderr, ' '.join([isinstance(arg, basestring) and arg or str(arg) for arg in args])
 
 
     def _process_result(self, result, output, results):    
-        if output:
+        if self.table_writer:
+            # Records are written to tables, in the main process
+            for record in result or []:
+                self.table_writer.add(record)
+        elif output:
+            if result is None and self.output_format == 'jsonl':
+                # No records: any line would not be a JSON object
+                return
             if isinstance(result, unicode):
                 result = result.encode("utf-8")
             print >>output, result
@@ -121,48 +289,351 @@ class Extractor:
             results.append(result)
 
 
+    def _iter_input_files(self, files):
+        """Generate (filename, relative_filename) for all files in given files/directories, in processing order"""
+
+        for dir_or_file in files:
+            dir_or_file = os.path.abspath(dir_or_file) 
+            
+            if os.path.isdir(dir_or_file):
+                # input is a directory
+                dir_name = dir_or_file
+                for path, dirs, files in os.walk(dir_name):
+                    for file in files:
+                        filename = os.path.join(path, file)
+                        relative_filename = re.sub('^' + dir_name + '/*', '', filename)
+                        yield filename, relative_filename
+            else:
+                # input is a file
+                filename = dir_or_file
+                assert os.path.exists(filename), filename + " does not exist"
+                relative_filename = os.path.basename(filename)
+                yield filename, relative_filename
+
+
+    def _iter_input_documents(self, files):
+        """Generate (filename, relative_filename, html) for all files in given files/directories, and 
+        all HTML documents in archives among them, in processing order (see _iter_documents())"""
+
+        return self._iter_documents(self._iter_input_files(files))
+
+
+    def _iter_documents(self, input_files):
+        """Generate (filename, relative_filename, html) for input files (pairs of filename and
+        relative_filename), and all HTML documents in archives among them (see sources.py).
+
+        html is None for files (they are read when processed). Documents from archives are named
+        after their URL (WARC files) or after the archive and their name in it (tar and zip 
+        archives); their relative file names are the URL without the scheme or their name in
+        the archive.
+        """
+
+        for filename, relative_filename in input_files:
+            if not archive_type(filename):
+                yield filename, relative_filename, None
+                continue
+            self.log("Reading archive", filename)
+            for name, data in iter_archive(filename):
+                if not self.is_html_document(name, data):
+                    continue
+                if '://' in name:
+                    document_filename = name
+                else:
+                    document_filename = os.path.join(filename, name)
+                yield document_filename, document_path(name), data
+
+
+    def _iter_tasks(self, files):
+        """Generate prepared files (see _prepare_file()) to process, for given files/directories"""
+
+        for filename, relative_filename, html in self._iter_input_documents(files):
+            task = self._prepare_file(filename, relative_filename, html)
+            if task is not None:
+                yield task
+
+
+    def _extract_from_files_parallel(self, files):
+        """Extract information from files using a pool of worker processes; generate (filename, result) in input order.
+
+        Output file names (and numbering of flattened files) are assigned here, in the main process.
+        """
+
+        pool = multiprocessing.Pool(self.jobs, _init_worker, (self,))
+
+        # The pool reads tasks ahead without limit, and tasks may hold documents from archives:
+        # keep a bounded number of tasks in the pool
+        slots = threading.Semaphore(16 * self.jobs)
+        stopped = threading.Event()
+
+        # Tasks are generated in the task handler thread of the pool, which drops exceptions (and
+        # results of tasks submitted before): they end the tasks, and are raised in this thread
+        errors = []
+        def bounded_tasks():
+            try:
+                for task in self._iter_tasks(files):
+                    while not slots.acquire(False):
+                        if stopped.is_set():
+                            return
+                        time.sleep(0.01)
+                    yield task
+            except Exception:
+                errors.append(sys.exc_info())
+
+        try:
+            for filename, result, encoding_stats, pages in pool.imap(_extract_in_worker, bounded_tasks(), 8):
+                slots.release()
+                self.encoding_detector.merge_stats(encoding_stats)
+                for page in pages:
+                    self.instrumentation.add_page(page)
+                yield filename, result
+            if errors:
+                raise errors[0][0], errors[0][1], errors[0][2]
+        except:
+            stopped.set()
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        pool.join()
+
+
+    def _iter_prefetched_files(self, files):
+        """Generate (task, document) for files to process, as _prepare_file() and _read_html() do.
+
+        Files are prepared and read, and their encodings detected, by a thread, up to self.prefetch 
+        files ahead. The document is None for files that are not HTML or cannot be read (they are 
+        then checked again, and errors reported, when processed).
+        """
+
+        queue = Queue.Queue(self.prefetch)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def read_files():
+            try:
+                for task in self._iter_tasks(files):
+                    filename, html = task[0], task[3]
+                    document = None
+                    try:
+                        if html is not None or self.is_html_file(filename):
+                            document = self._read_html(html, filename)
+                    except StandardError:
+                        pass
+                    if not put((task, document)):
+                        return
+                put(None)
+            except:
+                put(sys.exc_info())
+
+        thread = threading.Thread(target=read_files)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                if len(item) == 3:
+                    # Exception raised by the thread
+                    raise item[0], item[1], item[2]
+                yield item
+        finally:
+            stopped.set()
+            thread.join()
+
+
     def extract_from_file(self, filename, relative_filename=None):
         """Extract information from a file; return the result of extraction, or None if it cannot be computer or is saved to a file"""
         
+        task = self._prepare_file(filename, relative_filename)
+        if task is None:
+            return None
+        result = self._save_output(filename, self._extract_from_prepared_file(*task))
+        if self.output_sink:
+            self.output_sink.flush()
+        self._record_saved_files()
+        return result
+
+
+    def _get_output_sink(self):
+        """Return the sink where outputs of files are saved (opened on first use), or None if
+        outputs are not saved to files"""
+
+        if self.output_sink is None and self.output_format not in TABLE_FORMATS:
+            if self.output_archive:
+                self.output_sink = TarSink(self.output_archive, quiet=self.quiet)
+            elif self.output_dir:
+                self.output_sink = DirectorySink(self.output_dir, quiet=self.quiet)
+        return self.output_sink
+
+
+    def _save_output(self, filename, result):
+        """Save a result of _extract_from_prepared_file() for a file to the output sink if it is
+        an output and return None; return other results.
+
+        The file is recorded in the manifest (if any) only once its output is written, so that
+        files whose outputs were lost in a crash are processed again.
+        """
+
+        if not isinstance(result, Output):
+            self._record_file(filename)
+            return result
+        if filename in self.changed_files:
+            self.saved_files.append(filename)
+        if self._get_output_sink().write(result):
+            self._record_saved_files()
+        return None
+
+
+    def _close_output_sink(self):
+        if self.output_sink:
+            self.output_sink.close()
+            self.output_sink = None
+        self._record_saved_files()
+
+
+    def _get_manifest(self):
+        if self.manifest is None and self.manifest_filename:
+            self.manifest = Manifest(self.manifest_filename)
+        return self.manifest
+
+
+    def _record_file(self, filename):
+        """Record a processed file in the manifest, if any; return whether it was recorded"""
+
+        fingerprint = self.changed_files.pop(filename, None)
+        if fingerprint is None:
+            return False
+        self._get_manifest().record(filename, fingerprint)
+        return True
+
+
+    def _record_saved_files(self):
+        """Record the files whose outputs were written to the output sink in the manifest"""
+
+        for filename in self.saved_files:
+            self._record_file(filename)
+        self.saved_files = []
+        if self.manifest:
+            self.manifest.flush()
+
+
+    def _close_manifest(self):
+        if self.manifest:
+            self.manifest.close()
+            self.manifest = None
+        self.changed_files.clear()
+        self.saved_files = []
+
+
+    def extraction_version(self, filename=None):
+        """Return a string that changes when the result of extraction from a file may change (for
+        manifests of processed files): a digest of the source code of the extractor class and its
+        ancestors, the parser and the output format.
+
+        Extractors whose results depend on other data (e.g. a model) should add its version.
+        """
+
+        if self.code_version is None:
+            digest = hashlib.md5()
+            for cls in inspect.getmro(self.__class__):
+                try:
+                    f = open(inspect.getsourcefile(cls), 'rb')
+                except (TypeError, IOError):
+                    # Source code is not available
+                    digest.update(cls.__name__)
+                    continue
+                digest.update(f.read())
+                f.close()
+            digest.update(self.parser + ' ' + self.output_format)
+            if self.near_duplicates:
+                digest.update(' near duplicates %r' % self.near_duplicates.similarity)
+            self.code_version = digest.hexdigest()[:12]
+        return self.code_version
+
+
+    def _prepare_file(self, filename, relative_filename=None, html=None):
+        """Assign output file name to an input file (or a document from an archive, if html is given).
+
+        Returns (filename, relative_filename, output_name, html), or None if the file should be 
+        skipped; output_name is the name of the output in the output sink (relative to output_dir),
+        if any.
+        """
+        
         if not relative_filename:
             relative_filename = filename
             
-        output_filename = None    
-        if self.output_dir:
+        output_name = None    
+        sink = self._get_output_sink()
+        if sink:
             if self.flatten_files:
                 self.last_file_id += 1
                 relative_filename = str(self.last_file_id) + "." + self.output_format
-            output_filename = os.path.join(self.output_dir, relative_filename) 
+            output_name = relative_filename
 
-        if output_filename and os.path.exists(output_filename) and not self.overwrite:
-            print >>sys.stderr, "Skipping", filename, ": existing", output_filename
-            return None
+        manifest = self._get_manifest()
+        if manifest:
+            # Outputs of changed files are overwritten
+            fingerprint = manifest.fingerprint(filename, self.extraction_version(filename), html)
+            if fingerprint is None:
+                self.log("Skipping", filename, ": unchanged")
+                return None
+            self.changed_files[filename] = fingerprint
+        elif output_name and not self.overwrite:
+            if sink.exists(output_name):
+                self.log("Skipping", filename, ": existing output", output_name)
+                return None
+            # Other files with the same output name are skipped, even before this output is saved
+            sink.reserve(output_name)
+
+        return filename, relative_filename, output_name, html
         
 
-        print >>sys.stderr, "Processing", filename 
+    def _extract_from_prepared_file(self, filename, relative_filename, output_name, html=None, document=None):
+        """Extract information from a file (or a document from an archive, if html is given, or a 
+        document as returned by _read_html(), if given).
+
+        Returns the formatted result, or an Output to be saved to the output sink if output_name
+        is given (the file may be processed in a worker process).
+        """
+
+        self.log("Processing", filename)
             
+        instrumentation = self.instrumentation
+        start = instrumentation.start()
+        is_html = document is not None or html is not None or self.is_html_file(filename)
+        instrumentation.record(filename, 'detect', start)
+
         res = None
-        if self.is_html_file(filename):
-            res = self.extract_from_html(filename=filename, relative_filename=relative_filename)
+        if is_html:
+            res = self._extract_from_html(html, filename, relative_filename, document)
        
-        if not output_filename:
-            return res
-
-        output_dir_name = os.path.dirname(output_filename)
-        if output_dir_name and not os.path.isdir(output_dir_name):
-            os.makedirs(output_dir_name)
-        print >>sys.stderr, '    ', "saving output to", output_filename    
-        f = open(output_filename, 'w')
-        print >>f, res
-        f.close()
+        start = instrumentation.start()
+        if not output_name:
+            formatted = self.format_result(res, filename)
+            instrumentation.record(filename, 'format', start, 
+                                   bytes_out=isinstance(formatted, basestring) and len(formatted) or None)
+            instrumentation.end_page(filename)
+            return formatted
 
-        return None
+        f = StringIO()
+        self.format_result(res, filename, f)
+        output = Output(output_name, f.getvalue())
+        instrumentation.record(filename, 'format', start, bytes_out=len(output.data))
+        instrumentation.end_page(filename)
+        return output
 
     def cleanup_soup(self, soup):
-        """Remove scripts, styles, iframes, comments from soup"""
-        for node in soup.findAll(['script', 'style', 'iframe']) + \
-                    soup.findAll(text=lambda text:isinstance(text, (Comment, Declaration, ProcessingInstruction))):
-            node.extract()
+        """Remove scripts, styles, iframes, comments from soup; return the number of nodes visited"""
+        return walk_tree(soup, True, _enter_cleanup, _visit_cleanup_text)
 
             
             
@@ -171,35 +642,73 @@ class Extractor:
         
         Parameters:
           - html: string containing HTML of the document
-          - filename: file name of the document (either html or filename should be given)
+          - filename: file name of the document, read if html is not given; may also be a name given 
+            to the document, e.g. its URL (either html or filename should be given)
           - relative_filename: file name relative to the root directory
         """
 
-        if filename:
+        res = self._extract_from_html(html, filename, relative_filename)
+        start = self.instrumentation.start()
+        formatted = self.format_result(res, filename)
+        self.instrumentation.record(filename, 'format', start, 
+                                    bytes_out=isinstance(formatted, basestring) and len(formatted) or None)
+        self.instrumentation.end_page(filename)
+        return formatted
+
+
+    def _read_html(self, html, filename):
+        """Read an HTML document (from a file, unless html is given) and guess its encoding; 
+        return (html, encoding, detection method or None)"""
+
+        instrumentation = self.instrumentation
+        if html is None and filename:
+            start = instrumentation.start()
             f = open(filename)
             html = f.read()
             f.close()
+            instrumentation.record(filename, 'read', start, bytes_out=len(html))
         
         assert(html is not None)
 
         # Try to guess encoding
         encoding = self.encoding
+        method = None
         if encoding is None:
-            res = chardet.detect(html)
-            if 'encoding' in res:
-                encoding = res['encoding']
+            start = instrumentation.start()
+            encoding, method = self.encoding_detector.detect(html, filename)
+            instrumentation.record(filename, 'encoding', start, bytes_in=len(html))
+        return html, encoding, method
+
+
+    def _extract_from_html(self, html, filename, relative_filename, document=None):
+        """Parse an HTML document (or a document read by _read_html()) and extract information 
+        from it; return the result of extract_from_soup()"""
 
-        print >>sys.stderr, "Encoding: ", encoding    
+        if document is None:
+            document = self._read_html(html, filename)
+        html, encoding, method = document
+
+        if method:
+            self.log("Encoding: ", encoding, "(%s)" % method)
+        else:
+            self.log("Encoding: ", encoding)
+
+        instrumentation = self.instrumentation
+        start = instrumentation.start()
+        size = len(html)
 
         # Hack to handle <BR> and <HR> tags: convert them to paragraphs <P>
         #html = re.sub('(?i)<(br|hr)\W*>', '<p>', html)    
         
         # Hack: remove non-standard <wbr> tag that BeautifulSoup chokes on
         html = re.sub('(?i)<wbr\s*\/?\s*>', '', html)    
+        instrumentation.record(filename, 'preprocess', start, bytes_in=size, bytes_out=len(html))
         
         soup = None
         try:
-            soup = BeautifulSoup(html, fromEncoding=encoding, convertEntities=BeautifulStoneSoup.HTML_ENTITIES)
+            start = instrumentation.start()
+            soup = self.parse_html(html, encoding)
+            instrumentation.record(filename, 'parse', start, bytes_in=len(html))
         except StandardError, e:
             print >>sys.stderr, "ERROR parsing HTML from", filename 
             traceback.print_exc()
@@ -207,13 +716,57 @@ class Extractor:
                 
         res = None
         try:
-            self.cleanup_soup(soup)
+            start = instrumentation.start()
+            nodes = self.cleanup_soup(soup)
+            instrumentation.record(filename, 'cleanup', start, nodes=nodes)
+            if self.near_duplicates and self._is_near_duplicate(soup, filename):
+                return
+            start = instrumentation.start()
+            self.visited_nodes = None
             res = self.extract_from_soup(soup, filename=filename, relative_filename=relative_filename)
+            instrumentation.record(filename, 'extract', start, nodes=self.visited_nodes)
         except StandardError, e:
             print >>sys.stderr, "ERROR extracting from", filename 
             traceback.print_exc()
             return
-                        
+
+        return res
+
+
+    def _is_near_duplicate(self, soup, filename):
+        """Check whether the text of a page is a near-duplicate of a page processed before (and
+        index it if not)"""
+
+        start = self.instrumentation.start()
+        # Texts of the page, except those of scripts, styles, iframes and comments (which may
+        # not be removed yet)
+        texts = [text for text in soup.findAll(text=True)
+                 if not isinstance(text, REMOVED_TEXTS) and text.parent.name not in REMOVED_TAGS]
+        duplicate = self.near_duplicates.add(filename, u' '.join(texts))
+        self.instrumentation.record(filename, 'duplicates', start)
+        if duplicate is None:
+            return False
+
+        original, distance = duplicate
+        self.log("Skipping", filename, ": near-duplicate of", original)
+        if self.near_duplicates_list:
+            f = open(self.near_duplicates_list, 'a')
+            # A single write, so that lines written by several processes are not mixed
+            f.write('%s\t%s\t%d\n' % (filename, original, distance))
+            f.close()
+        return True
+
+
+    def format_result(self, res, filename=None, output=None):
+        """Convert the result of extract_from_soup() to the output format.
+
+        If 'output' (a file descriptor) is given, the formatted result is written there, encoded
+        in UTF-8 and followed by a newline, and None is returned. Text ('txt') output and XML 
+        output of objects are then written piece by piece, without building the whole string 
+        in memory.
+        """
+
+        formatted = None
         if res:                    
             try:
                 if isinstance(res, Tag):
@@ -221,44 +774,75 @@ class Extractor:
                     if filename:
                         res['filename'] = filename
                     if self.output_format == 'soup':
-                        return res
+                        formatted = res
+                    elif self.output_format in ('jsonl',) + TABLE_FORMATS:
+                        formatted = self.format_records([{'_type': 'page', 'text': self.soup_to_text(res)}], filename)
                     elif self.output_format == 'txt':
-                        return self.soup_to_text(res)
+                        if output:
+                            self.write_text(res, output)
+                            print >>output
+                            return None
+                        formatted = self.soup_to_text(res)
                     else:    
-                        return res.prettify()
+                        formatted = res.prettify()
+                elif self.output_format in ('jsonl',) + TABLE_FORMATS:
+                    formatted = self.format_records(res, filename)
                 else:
-                    # Extraction result is an object: serialize as XML, ignoring output_format
-                    res = self.serialize_to_xml(res)
-                    if filename:
-                        res.setAttribute('filename', filename)
-                    return res.toprettyxml('    ', '\n', 'utf8')
+                    # Extraction result is an object: serialize as XML, ignoring other output formats
+                    if output:
+                        for piece in self.iter_xml(res, filename):
+                            output.write(piece.encode("utf-8"))
+                        print >>output
+                        return None
+                    formatted = u''.join(self.iter_xml(res, filename)).encode("utf-8")
             except StandardError, e:
                 print >>sys.stderr, "ERROR generating output for", filename 
                 traceback.print_exc()
-                return None
+                formatted = None
+
+        if not output or (formatted is None and self.output_format == 'jsonl'):
+            return formatted
+
+        if isinstance(formatted, unicode):
+            formatted = formatted.encode("utf-8")
+        print >>output, formatted
+        return None
+
                 
     @staticmethod
     def soup_to_text(soup):
+        """Return raw text of the page body, with newlines for block-level elements"""
+
+        return ''.join(Extractor.iter_text(soup))
+
+    @staticmethod
+    def write_text(soup, output):
+        """Write raw text of the page body (as returned by soup_to_text) to a file descriptor, in UTF-8"""
+
+        for piece in Extractor.iter_text(soup):
+            if isinstance(piece, unicode):
+                piece = piece.encode("utf-8")
+            output.write(piece)
+
+    @staticmethod
+    def iter_text(soup):
+        """Generate pieces of raw text of the page body: concatenated, they give soup_to_text()"""
 
         # Remove scripts, styles, iframes, comments
-        for node in soup.findAll(['script', 'style', 'iframe']) + \
-                    soup.findAll(text=lambda text:isinstance(text, (Comment, Declaration, ProcessingInstruction))):
-            node.extract()
+        walk_tree(soup, True, _enter_cleanup, _visit_cleanup_text)
 
         # Keep only page title and body, extract only raw text
-        text = ''
-        newline = True
-        for node in soup.findAll(['body']):
-            for e in node.recursiveChildGenerator():
-                if isinstance(e,unicode):
-                    text += re.sub(r"\s+", " ", e)
-                elif isinstance(e, Tag) and e.name.lower() in BLOCK_LEVEL_TAGS:
-                    text += "\n"
+        def pieces():
+            for node in soup.findAll(['body']):
+                for e in node.recursiveChildGenerator():
+                    if isinstance(e,unicode):
+                        yield SPACES.sub(" ", e)
+                    elif isinstance(e, Tag) and e.name.lower() in BLOCK_LEVEL_TAGS:
+                        yield "\n"
 
         # Avoid three or more empty lines in a row
-        text = re.sub(r"\n\s*\n\s*\n", "\n", text)
-           
-        return text    
+        for piece in collapse_blank_lines(pieces()):
+            yield piece
    
     def extract_from_soup(self, soup, filename, relative_filename):
         """Extract data from a parsed HTML (BeautifulSoup) obtained from a given file."""
@@ -267,103 +851,280 @@ class Extractor:
 
 
     def is_html_file(self, filename):
-        ret = subprocess.call('file "%s" | grep -q HTML' % filename, shell=True)
-        if ret == 0:
+        """Check whether a file contains HTML, looking at its name and at its first bytes"""
+
+        if not self.matches_html_patterns(filename):
+            return False
+
+        try:
+            f = open(filename, 'rb')
+            head = f.read(HTML_SNIFF_SIZE)
+            f.close()
+        except IOError:
+            return False
+
+        return self.looks_like_html(head)
+
+    def is_html_document(self, name, data):
+        """Check whether a document (e.g. from an archive) contains HTML, looking at its name and at its first bytes"""
+
+        return self.matches_html_patterns(name) and self.looks_like_html(data[:HTML_SNIFF_SIZE])
+
+    def matches_html_patterns(self, filename):
+        """Check whether the base name of a file matches html_patterns, if given"""
+
+        if not self.html_patterns:
             return True
-        else:
+        name = os.path.basename(filename)
+        return bool([pattern for pattern in self.html_patterns if fnmatch.fnmatch(name, pattern)])
+
+    @staticmethod
+    def looks_like_html(data):
+        """Check whether a string (the beginning of a document) looks like HTML"""
+
+        if data.startswith(codecs.BOM_UTF16_LE) or data.startswith(codecs.BOM_UTF16_BE):
+            data = data.decode('utf-16', 'replace').encode('utf-8')
+
+        if BINARY_CHARS.search(data):
             return False
+        if XML_START.match(data):
+            return XHTML_SIGNATURE.search(data) is not None
+        return HTML_SIGNATURE.search(data) is not None
      
 
 
     def get_text(self, node):
-        text = ''
+        text = []
         for e in node.recursiveChildGenerator():
             if isinstance(e, Comment) or isinstance(e, Declaration) or isinstance(e, ProcessingInstruction):
                 pass
             elif isinstance(e,unicode):
-                text += e
+                text.append(e)
             elif isinstance(e, Tag) and e.name.lower() in ('p', 'br'):
-                text += '-NEWLINE-'
-        text = self.clean_string(text)        
+                text.append('-NEWLINE-')
+        text = self.clean_string(''.join(text))        
         return text                  
 
 
     def clean_string(self, s):
-        s = re.sub('(?i)&\w*quo\w*;', '"', s)
-        s = re.sub('(?i)&#*\w+;', ' ', s)
-        s = re.sub('\s+', ' ', s)
-        s = re.sub(r'\s*(-NEWLINE-\s*)+', '\n', s)
-        s = re.sub('^\s+|\s+$', '', s)
-        return s
+        """Replace entities, normalize whitespace and convert -NEWLINE- markers to newlines"""
+        if '&' in s:
+            s = QUOTE_ENTITY.sub('"', s)
+            s = ENTITY.sub(' ', s)
+        if IRREGULAR_SPACES.search(s):
+            s = SPACES.sub(' ', s)
+        if '-NEWLINE-' in s:
+            s = NEWLINES.sub('\n', s)
+        return s.strip(SPACE_CHARS)
+
+
+    def format_records(self, res, filename=None):
+        """Convert the result of extraction to records for output formats 'jsonl' and tables.
+
+        Returns a list of records (see records.record_to_json()), one per record in the result (if 
+        it is a list) or the result itself; for 'jsonl', returns the records in JSON, one per line.
+        Results other than records are wrapped in 'items' records.
+        """
 
+        if not isinstance(res, list):
+            res = [res]
+        records = []
+        for obj in res:
+            if isinstance(obj, dict):
+                # Already a record (text of a page)
+                record = dict(obj)
+            else:
+                record = record_to_json(obj, self.clean_string)
+            if not isinstance(record, dict):
+                record = {'_type': 'items', 'items': record}
+            if filename:
+                record['_filename'] = filename
+            records.append(record)
 
-    def serialize_to_xml(self, obj, tag_name = 'items', parent = None, doc = None):
-        """Convert object to XML"""    
+        if self.output_format == 'jsonl':
+            return u'\n'.join(json.dumps(record, ensure_ascii=False, sort_keys=True) for record in records)
+        return records
+
+    def iter_xml(self, obj, filename=None):
+        """Generate pieces of XML (unicode strings) representing an object: the <items> element 
+        with attribute 'filename', containing elements for the object, indented and one per line"""
+
+        attributes = u''
+        if filename:
+            if not isinstance(filename, unicode):
+                filename = filename.decode("utf-8", "replace")
+            attributes = u' filename="%s"' % escape_xml(filename)
+        return xml_element(u'items', attributes, u'', self._iter_xml_elements(obj, u'items', XML_INDENT))
+
+    def _iter_xml_elements(self, obj, tag_name, indent):
+        """Generate pieces of XML of the elements representing an object"""    
         
-        return_doc = False
-        if not doc:
-            doc = xml.dom.minidom.Document()
-            return_doc = True
-
-        if not parent:
-            parent = doc.createElement(tag_name)
-            doc.appendChild(parent)      
-          
         if isinstance(obj, (int, datetime, date)):
-            res = doc.createElement(tag_name)
-            res.appendChild(doc.createTextNode(unicode(obj)))
-            parent.appendChild(res)
+            yield u'%s<%s>%s</%s>\n' % (indent, tag_name, escape_xml(unicode(obj)), tag_name)
         elif isinstance(obj, basestring):
-            res = doc.createElement(tag_name)
-            res.appendChild(doc.createTextNode(self.clean_string(obj)))
-            parent.appendChild(res)
+            yield u'%s<%s>%s</%s>\n' % (indent, tag_name, escape_xml(self.clean_string(obj)), tag_name)
         elif isinstance(obj, list):
             for elt in obj:
-                self.serialize_to_xml(elt, tag_name, parent, doc)
+                for piece in self._iter_xml_elements(elt, tag_name, indent):
+                    yield piece
         elif hasattr(obj, '__class__'):
-            tag_name = re.sub('.*\.', '', str(obj.__class__).lower())
-            res = doc.createElement(tag_name)
-            for elt in sorted(obj.__dict__):
-                self.serialize_to_xml(getattr(obj, elt), elt, res, doc)
-            parent.appendChild(res)            
+            tag_name = record_type(obj)
+            children = (piece for elt in sorted(obj.__dict__) 
+                              for piece in self._iter_xml_elements(getattr(obj, elt), elt, indent + XML_INDENT))
+            for piece in xml_element(tag_name, u'', indent, children):
+                yield piece
         else:
             raise NotImplementedError("don't know how to serialize %s %s", type(obj), obj)          
-        
-        if return_doc:            
-            return parent
-
-
-
-def nicer_writexml(self, writer, indent="", addindent="", newl=""):
-        """Hack to make the output of xml.dom.minidom.toprettyxml nicer"""
-        # indent = current indentation
-        # addindent = indentation to add to higher levels
-        # newl = newline string
-        writer.write(indent+"<" + self.tagName)
-
-        attrs = self._get_attributes()
-        a_names = attrs.keys()
-        a_names.sort()
-
-        for a_name in a_names:
-            writer.write(" %s=\"" % a_name)
-            xml.dom.minidom._write_data(writer, attrs[a_name].value)
-            writer.write("\"")
-        if self.childNodes:
-            if len(self.childNodes) == 1 and self.childNodes[0].nodeType == xml.dom.minidom.Node.TEXT_NODE:
-                writer.write(">")
-                self.childNodes[0].writexml(writer, "", "", "")
-                writer.write("</%s>%s" % (self.tagName, newl))
-                return
-            writer.write(">%s"%(newl))
-            for node in self.childNodes:
-                node.writexml(writer,indent+addindent,addindent,newl)
-            writer.write("%s</%s>%s" % (indent,self.tagName,newl))
+
+
+def escape_xml(data):
+    """Escape a text or an attribute value for XML output"""
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def xml_element(tag_name, attributes, indent, children):
+    """Generate pieces of XML of an element with given (formatted) attributes and children (pieces 
+    of XML of the child elements): one line for the start tag, then the children and the end tag,
+    or one line for an empty element"""
+
+    start = u'%s<%s%s' % (indent, tag_name, attributes)
+    empty = True
+    for piece in children:
+        if empty:
+            yield start + u'>\n'
+            empty = False
+        yield piece
+    if empty:
+        yield start + u'/>\n'
+    else:
+        yield u'%s</%s>\n' % (indent, tag_name)
+
+
+def collapse_blank_lines(pieces):
+    """Replace three or more newlines in a row (possibly with whitespace between them) by one.
+
+    Takes and generates pieces of text: the result is the same as BLANK_LINES.sub("\\n", "".join(pieces)).
+    """
+
+    # Whitespace pending at the end of the pieces seen so far
+    spaces = []
+    for piece in pieces:
+        stripped = piece.lstrip(SPACE_CHARS)
+        if not stripped:
+            spaces.append(piece)
+            continue
+        spaces.append(piece[:len(piece) - len(stripped)])
+        yield BLANK_LINES.sub("\n", ''.join(spaces))
+        content = stripped.rstrip(SPACE_CHARS)
+        if '\n' in content:
+            yield BLANK_LINES.sub("\n", content)
         else:
-            writer.write("/>%s"%(newl))
+            yield content
+        spaces = [stripped[len(content):]]
+    yield BLANK_LINES.sub("\n", ''.join(spaces))
+
+
+def walk_tree(root, state, enter_element, visit_text, leave_element=None):
+    """Walk the descendants of a soup element depth-first, without recursion.
+
+    Calls, for the children of each element in order:
+     - visit_text(node, number, state) for texts (number: position among the children, from 1)
+     - enter_element(node, number, state) for elements (pre-order): returns the state for the 
+       children of the element, or None to skip them; if enter_element is None, the children 
+       of all elements are walked with the state of the root
+     - leave_element(node) for elements after their children (post-order), unless they were skipped
+    The state of the root is 'state'. If visit_text() or leave_element() returns True, the node
+    is extracted from the tree (callbacks should not extract nodes themselves); numbers of the 
+    following siblings are not changed. If visit_text() or enter_element() returns EXTRACT, the 
+    node is extracted and the following siblings are numbered as if it was never in the tree.
+
+    Returns the number of nodes visited.
+    """
+
+    # Stack of the elements being walked, with their states, the indices of their next children
+    # in contents and the numbers of the children visited so far
+    elements = [root]
+    states = [state]
+    indices = [0]
+    numbers = [0]
+    visited = 0
+    while elements:
+        element = elements[-1]
+        index = indices[-1]
+        if index >= len(element.contents):
+            elements.pop()
+            states.pop()
+            indices.pop()
+            numbers.pop()
+            if elements:
+                if leave_element and leave_element(element):
+                    extract_child(elements[-1], indices[-1])
+                else:
+                    indices[-1] += 1
+            continue
+
+        node = element.contents[index]
+        numbers[-1] += 1
+        visited += 1
+        if isinstance(node, NavigableString):
+            removed = visit_text(node, numbers[-1], states[-1])
+            if removed:
+                extract_child(element, index)
+                if removed is EXTRACT:
+                    numbers[-1] -= 1
+                continue
+        elif isinstance(node, Tag):
+            if enter_element:
+                sub_state = enter_element(node, numbers[-1], states[-1])
+            else:
+                sub_state = state
+            if sub_state is EXTRACT:
+                extract_child(element, index)
+                numbers[-1] -= 1
+                continue
+            if sub_state is not None:
+                elements.append(node)
+                states.append(sub_state)
+                indices.append(0)
+                numbers.append(0)
+                continue
+        indices[-1] += 1
+
+    return visited
+
+
+def extract_child(element, index):
+    """Extract a child of an element by its index (Tag.extract() looks up the index in contents)"""
+    node = element.contents.pop(index)
+    node.parent = None
+    node.extract()
+
+
+def _enter_cleanup(node, number, state):
+    if node.name in REMOVED_TAGS:
+        return EXTRACT
+    return state
+
+
+def _visit_cleanup_text(node, number, state):
+    if isinstance(node, REMOVED_TEXTS):
+        return EXTRACT
+
+
+def _init_worker(extractor):
+    """Initialize a worker process of Extractor._extract_from_files_parallel()"""
+    global _worker_extractor
+    _worker_extractor = extractor
+    # Records of pages are sent to the main process with the results
+    extractor.instrumentation.deferred = True
+
 
+def _extract_in_worker(task):
+    """Process a single file in a worker process; return its name, the result, encoding detection statistics
+    and records of the instrumentation"""
+    result = _worker_extractor._extract_from_prepared_file(*task)
+    return (task[0], result, _worker_extractor.encoding_detector.pop_stats(), 
+            _worker_extractor.instrumentation.pop_finished())
 
-# Replace writexml() with the hacked version
-xml.dom.minidom.Element.writexml = nicer_writexml
 
 
@@ -0,0 +1,154 @@
+"""Instrumentation of extraction: time, bytes and nodes by processing stage
+
+Stages of processing a page, in order:
+ - detect: check whether the file contains HTML
+ - read: read the file (bytes_out: size of the document)
+ - encoding: guess the character encoding (bytes_in: size of the document)
+ - preprocess: fix the HTML with regular expressions (bytes_in, bytes_out)
+ - parse: build the tree with the HTML parser (bytes_in)
+ - cleanup: Extractor.cleanup_soup() (nodes: nodes visited)
+ - duplicates: detection of near-duplicate pages (if requested, see duplicates.py)
+ - extract: Extractor.extract_from_soup() (nodes: nodes visited, if the extractor counts them)
+ - format: Extractor.format_result() (bytes_out: size of the formatted result, if known)
+
+For each page and stage, wall-clock time and CPU time of the process (both in seconds) are
+recorded. Records of pages can be written to a trace file, as JSON objects, one per line;
+summary() aggregates them by stage.
+"""
+
+import time
+import json
+
+STAGES = ['detect', 'read', 'encoding', 'preprocess', 'parse', 'cleanup', 'duplicates', 'extract', 'format']
+
+COUNTERS = ['bytes_in', 'bytes_out', 'nodes']
+
+
+class Instrumentation:
+    """Record time, bytes and nodes by page and processing stage"""
+
+    def __init__(self, trace=None):
+        """Create an instrumentation; records of pages are written to the file named trace, if given"""
+
+        self.trace_filename = trace
+        self.trace = None
+
+        ## whether records of finished pages are kept for pop_finished() (in worker processes)
+        ## instead of being added to the totals
+        self.deferred = False
+
+        ## pages being processed: page -> stage -> record (wall, cpu and counters)
+        self.pages = dict()
+
+        ## finished pages not added to the totals yet, when deferred
+        self.finished = []
+
+        ## totals: stage -> record (pages, wall, cpu and counters)
+        self.totals = dict()
+        self.page_count = 0
+
+    @staticmethod
+    def start():
+        """Return the start time of a stage, to be passed to record()"""
+        return time.time(), time.clock()
+
+    def record(self, page, stage, start, bytes_in=None, bytes_out=None, nodes=None):
+        """Record a stage of processing a page (a file name), started at a time returned by start()"""
+
+        stages = self.pages.setdefault(page, {})
+        record = stages.get(stage)
+        if record is None:
+            record = stages[stage] = {'wall': 0.0, 'cpu': 0.0}
+        record['wall'] += time.time() - start[0]
+        record['cpu'] += time.clock() - start[1]
+        for name, value in (('bytes_in', bytes_in), ('bytes_out', bytes_out), ('nodes', nodes)):
+            if value is not None:
+                record[name] = record.get(name, 0) + value
+
+    def end_page(self, page):
+        """Finish recording a page"""
+
+        record = {'page': page, 'stages': self.pages.pop(page, {})}
+        if self.deferred:
+            self.finished.append(record)
+        else:
+            self.add_page(record)
+
+    def pop_finished(self):
+        """Return records of finished pages (when deferred) and forget them"""
+
+        finished = self.finished
+        self.finished = []
+        return finished
+
+    def add_page(self, record):
+        """Add the record of a finished page to the totals and to the trace"""
+
+        self.page_count += 1
+        for stage, values in record['stages'].items():
+            if stage not in self.totals:
+                self.totals[stage] = {'pages': 0}
+            totals = self.totals[stage]
+            totals['pages'] += 1
+            for name, value in values.items():
+                totals[name] = totals.get(name, 0) + value
+
+        if self.trace_filename:
+            if self.trace is None:
+                self.trace = open(self.trace_filename, 'w')
+            self.trace.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def summary(self):
+        """Return totals by stage (and over all stages) as a dictionary, ready for JSON"""
+
+        stages = dict()
+        for stage, totals in self.totals.items():
+            stages[stage] = dict(totals)
+            stages[stage]['wall_ms_per_page'] = 1000 * totals['wall'] / totals['pages']
+        return {'pages': self.page_count,
+                'wall': sum([totals['wall'] for totals in self.totals.values()]),
+                'cpu': sum([totals['cpu'] for totals in self.totals.values()]),
+                'stages': stages}
+
+    def report(self):
+        """Return a text table of the totals by stage"""
+
+        lines = ["Time by stage (%d pages):" % self.page_count]
+        wall = sum([totals['wall'] for totals in self.totals.values()]) or 1.0
+        for stage in STAGES + sorted(set(self.totals) - set(STAGES)):
+            if stage in self.totals:
+                totals = self.totals[stage]
+                counters = ''.join(['  %s %d' % (name, totals[name]) for name in COUNTERS if name in totals])
+                lines.append("    %-11s %8.3f s wall %8.3f s cpu %5.1f%%%s" %
+                             (stage, totals['wall'], totals['cpu'], 100 * totals['wall'] / wall, counters))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
+
+
+class NullInstrumentation:
+    """Instrumentation that records nothing (when instrumentation is off)"""
+
+    deferred = False
+
+    @staticmethod
+    def start():
+        return None
+
+    def record(self, page, stage, start, bytes_in=None, bytes_out=None, nodes=None):
+        pass
+
+    def end_page(self, page):
+        pass
+
+    def pop_finished(self):
+        return []
+
+    def add_page(self, record):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,115 @@
+"""Manifest of processed input files, for incremental extraction
+
+A manifest maps the name of each processed input file to its size, modification time, content
+digest (MD5) and the version of the extraction (see Extractor.extraction_version()). With a
+manifest, an extractor only processes new files, files whose content changed and files whose
+extraction version changed (e.g. after a change of the extractor code or of the cleanup model).
+Files with a new modification time but the same content are not processed again.
+
+The manifest is a text file with one tab-separated line per entry. Entries are appended as files
+are processed (the last entry of a file wins); the file is rewritten without replaced entries
+when it is closed, if they are numerous.
+"""
+
+import os
+import hashlib
+
+
+class Manifest:
+    """Persistent manifest of processed files"""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        ## file name -> (size, modification time, digest, version), all strings
+        self.entries = dict()
+
+        ## number of lines in the manifest file
+        self.lines = 0
+
+        if os.path.exists(filename):
+            for line in open(filename, 'rb'):
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 5:
+                    self.entries[fields[0].decode('string_escape')] = tuple(fields[1:])
+                    self.lines += 1
+
+        self.file = None
+
+    def fingerprint(self, filename, version, data=None):
+        """Return the fingerprint (size, modification time, digest, version) of a file that is new
+        or changed since it was recorded, or None if the file is unchanged.
+
+        For documents read from archives, the content is given as data (there is no modification time).
+        """
+
+        if data is not None:
+            fingerprint = (str(len(data)), '', hashlib.md5(data).hexdigest(), version)
+            if self.entries.get(filename) == fingerprint:
+                return None
+            return fingerprint
+
+        try:
+            stat = os.stat(filename)
+            size, mtime = str(stat.st_size), repr(stat.st_mtime)
+        except OSError:
+            return ('', '', '', version)
+
+        entry = self.entries.get(filename)
+        if entry and entry[:2] == (size, mtime) and entry[3] == version:
+            return None
+
+        try:
+            digest = file_digest(filename)
+        except IOError:
+            return (size, mtime, '', version)
+        if entry and entry[2] == digest and entry[3] == version:
+            # Same content: remember the new modification time, to avoid computing the digest again
+            self.record(filename, (size, mtime, digest, version))
+            return None
+        return (size, mtime, digest, version)
+
+    def record(self, filename, fingerprint):
+        """Record the fingerprint of a processed file"""
+
+        if self.file is None:
+            self.file = open(self.filename, 'ab')
+        self.entries[filename] = fingerprint
+        # A single write, so that lines written by several threads are not mixed
+        self.file.write('\t'.join((filename.encode('string_escape'),) + tuple(fingerprint)) + '\n')
+        self.lines += 1
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+        if self.lines > 2 * len(self.entries) + 1000:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the manifest file with only the last entry of each file"""
+
+        f = open(self.filename + '.tmp', 'wb')
+        for filename in sorted(self.entries):
+            f.write('\t'.join((filename.encode('string_escape'),) + tuple(self.entries[filename])) + '\n')
+        f.close()
+        os.rename(self.filename + '.tmp', self.filename)
+        self.lines = len(self.entries)
+
+
+def file_digest(filename, block_size=2**20):
+    """MD5 digest of the content of a file, in hex"""
+
+    digest = hashlib.md5()
+    f = open(filename, 'rb')
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        digest.update(block)
+    f.close()
+    return digest.hexdigest()
@@ -0,0 +1,478 @@
+"""Storage formats of cleanup models"""
+
+import os, sys
+import ast
+import mmap
+import struct
+import zlib
+import cPickle
+from collections import OrderedDict
+
+# Binary model format: header, offsets of the tries (since version 2), hash index of paths, table
+# of entries sorted by path, paths in UTF-8, then (since version 2) the tries of path components
+# and the hash table of templates (see BinaryTrieNode)
+BINARY_MODEL_MAGIC = 'CLNMODEL'
+BINARY_MODEL_VERSION = 2
+HEADER = struct.Struct('<8sIII')     # magic, version, number of paths, number of index slots
+TRIES = struct.Struct('<II')         # offsets of the root of the trie and of the table of templates (0: none)
+SLOT = struct.Struct('<I')           # number of entry + 1 (0: empty slot)
+ENTRY = struct.Struct('<IId')        # offset and length of the path, score
+
+# Trie node: header, numbers of texts (sorted), scores of texts, hash table of children, keys
+NODE = struct.Struct('<dII')         # highest score of a text in the subtree, number of texts, number of child slots
+KEY = struct.Struct('<IIII')         # hash, offset and length of the key (path component or template), offset of the node (0: empty slot)
+NUMBER = struct.Struct('<I')
+SCORE = struct.Struct('<d')
+
+# Separator of the filename template and the path in paths of per-template models (see
+# CleanupModelLearner): file names cannot contain it, while tabs can occur in paths (in classes
+# and ids of elements)
+TEMPLATE_SEPARATOR = '\0'
+
+# Path in models with per-template models (with score 0): only their paths are split into
+# template and path
+TEMPLATES_KEY = TEMPLATE_SEPARATOR
+
+
+def encode_path(path):
+    if isinstance(path, unicode):
+        return path.encode("utf-8")
+    return path
+
+
+def path_hash(encoded_path):
+    return zlib.crc32(encoded_path) & 0xffffffff
+
+
+def table_slots(count):
+    """Number of slots of a hash table with a given number of entries"""
+
+    slots = 1
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+def dump_binary_model(model):
+    """Convert a cleanup model (a dictionary: path -> score) to a string in the binary format"""
+
+    paths = sorted([encode_path(path) for path in model])
+    scores = dict([(encode_path(path), score) for path, score in model.items()])
+
+    slots = table_slots(len(paths))
+    index = [0] * slots
+    entries = []
+    offset = 0
+    for i, path in enumerate(paths):
+        slot = path_hash(path) & (slots - 1)
+        while index[slot]:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = i + 1
+        entries.append(ENTRY.pack(offset, len(path), scores[path]))
+        offset += len(path)
+
+    chunks = [struct.pack('<%dI' % slots, *index), ''.join(entries), ''.join(paths)]
+    offset = HEADER.size + TRIES.size + sum([len(chunk) for chunk in chunks])
+
+    # Tries of path components of the model and of the models of templates, as compiled by
+    # PageCleaner.compile_model() (but keeping all texts)
+    tries = dict()
+    templated = TEMPLATES_KEY in scores
+    for path in paths:
+        if templated and path == TEMPLATES_KEY:
+            continue
+        template = None
+        trie_path = path
+        if templated and TEMPLATE_SEPARATOR in path:
+            template, trie_path = path.split(TEMPLATE_SEPARATOR, 1)
+        components = trie_path.split('/')
+        node = tries.setdefault(template, ({}, {}))
+        for component in components[1:-1]:
+            node = node[0].setdefault(component, ({}, {}))
+        # Paths of texts always end with /@<number>
+        node[1][int(components[-1][1:])] = scores[path]
+
+    root, score, offset = dump_trie_node(tries.pop(None, ({}, {})), offset, chunks)
+    templates = 0
+    if tries:
+        entries = []
+        for template in sorted(tries):
+            node, score, offset = dump_trie_node(tries[template], offset, chunks)
+            entries.append((template, node))
+        templates = offset
+        table_size = table_slots(len(entries))
+        chunks.append(struct.pack('<I', table_size))
+        offset = dump_table(entries, table_size, offset + 4, chunks)
+
+    return HEADER.pack(BINARY_MODEL_MAGIC, BINARY_MODEL_VERSION, len(paths), slots) + \
+           TRIES.pack(root, templates) + ''.join(chunks)
+
+
+def dump_trie_node(node, offset, chunks):
+    """Append a trie node ((children by key, scores by number of text)) and its descendants to
+    chunks, starting at offset; return the offset of the node, the highest score of a text in
+    its subtree and the offset after it"""
+
+    children, texts = node
+    max_score = max(texts.values() + [0.0])
+    entries = []
+    for key in sorted(children):
+        child, score, offset = dump_trie_node(children[key], offset, chunks)
+        entries.append((key, child))
+        max_score = max(max_score, score)
+
+    node_offset = offset
+    numbers = sorted(texts)
+    slots = entries and table_slots(len(entries)) or 0
+    chunks.append(NODE.pack(max_score, len(numbers), slots))
+    chunks.append(struct.pack('<%dI%dd' % (len(numbers), len(numbers)), *(numbers + [texts[number] for number in numbers])))
+    offset = dump_table(entries, slots, offset + NODE.size + 12 * len(numbers), chunks)
+    return node_offset, max_score, offset
+
+
+def dump_table(entries, slots, offset, chunks):
+    """Append a hash table of (key, node offset) entries with a given number of slots, followed by
+    the keys, to chunks, starting at offset; return the offset after it"""
+
+    table = [KEY.pack(0, 0, 0, 0)] * slots
+    keys = []
+    key_offset = offset + KEY.size * slots
+    for key, node in entries:
+        hash = path_hash(key)
+        slot = hash & (slots - 1)
+        while table[slot] != EMPTY_KEY:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = KEY.pack(hash, key_offset, len(key), node)
+        keys.append(key)
+        key_offset += len(key)
+    chunks.append(''.join(table))
+    chunks.append(''.join(keys))
+    return key_offset
+
+
+EMPTY_KEY = KEY.pack(0, 0, 0, 0)
+
+
+def find_key(data, offset, slots, key):
+    """Return the node offset of a key in a hash table with a given number of slots, or 0"""
+
+    hash = path_hash(key)
+    slot = hash & (slots - 1)
+    while True:
+        key_hash, key_offset, length, node = KEY.unpack_from(data, offset + KEY.size * slot)
+        if not node:
+            return 0
+        if key_hash == hash and data[key_offset:key_offset + length] == key:
+            return node
+        slot = (slot + 1) & (slots - 1)
+
+
+class BinaryTrieNode:
+    """Node of the trie of path components of a binary cleanup model, read on demand from the
+    memory-mapped model and used as the tries compiled by PageCleaner.compile_model(): get()
+    returns the child for a path component (if some text below it has a score above the 
+    threshold), 'number in node' checks whether the text with this number has a score above the
+    threshold, and the node is false if no text in its subtree has.
+
+    The root of a model with per-template models has a table of their tries (templates).
+    """
+
+    templates = None
+
+    def __init__(self, data, offset, threshold):
+        self.data = data
+        self.offset = offset
+        self.threshold = threshold
+        self.max_score, self.texts, self.slots = NODE.unpack_from(data, offset)
+
+    def __nonzero__(self):
+        return self.max_score > self.threshold
+
+    def get(self, component, default=None):
+        if not self.slots:
+            return default
+        node = find_key(self.data, self.offset + NODE.size + 12 * self.texts, self.slots, encode_path(component))
+        if not node:
+            return default
+        node = BinaryTrieNode(self.data, node, self.threshold)
+        if not node:
+            return default
+        return node
+
+    def __contains__(self, number):
+        # Binary search in the sorted numbers, read from the mapped model one at a time
+        numbers_offset = self.offset + NODE.size
+        low, high = 0, self.texts
+        while low < high:
+            middle = (low + high) // 2
+            if NUMBER.unpack_from(self.data, numbers_offset + NUMBER.size * middle)[0] < number:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.texts or NUMBER.unpack_from(self.data, numbers_offset + NUMBER.size * low)[0] != number:
+            return False
+        score_offset = numbers_offset + NUMBER.size * self.texts + SCORE.size * low
+        return SCORE.unpack_from(self.data, score_offset)[0] > self.threshold
+
+
+class BinaryTemplates:
+    """Table of the tries of per-template models of a binary cleanup model"""
+
+    def __init__(self, data, offset, threshold):
+        self.data = data
+        self.slots = struct.unpack_from('<I', data, offset)[0]
+        self.offset = offset + 4
+        self.threshold = threshold
+
+    def get(self, template, default=None):
+        """Return the root of the trie of a template, or default if it has no texts above the threshold"""
+
+        node = find_key(self.data, self.offset, self.slots, encode_path(template))
+        if not node:
+            return default
+        node = BinaryTrieNode(self.data, node, self.threshold)
+        if not node:
+            return default
+        return node
+
+
+class BinaryCleanupModel:
+    """Read-only cleanup model in the binary format, memory-mapped from a file.
+
+    Opening a model takes constant time; memory pages of the model are loaded on demand and
+    shared by all processes that use the same file (e.g., workers of a parallel extraction).
+    Supports the dictionary operations used by PageCleaner: 'in', [], get(), len() and iteration.
+    """
+
+    def __init__(self, filename):
+        f = open(filename, 'rb')
+        self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+
+        magic, version, self.size, self.slots = HEADER.unpack_from(self.data, 0)
+        assert magic == BINARY_MODEL_MAGIC, filename + " is not a binary cleanup model"
+        assert version in (1, BINARY_MODEL_VERSION), "unsupported version %d of binary cleanup model %s" % (version, filename)
+
+        # Models of version 1 have no tries
+        self.index_offset = HEADER.size
+        self.root_offset = self.templates_offset = 0
+        if version > 1:
+            self.root_offset, self.templates_offset = TRIES.unpack_from(self.data, HEADER.size)
+            self.index_offset += TRIES.size
+        self.entries_offset = self.index_offset + SLOT.size * self.slots
+        self.paths_offset = self.entries_offset + ENTRY.size * self.size
+
+    def trie(self, threshold):
+        """Return the root of the trie of path components (a BinaryTrieNode) for a threshold of
+        scores, or None if the model has no trie (version 1)"""
+
+        if not self.root_offset:
+            return None
+        root = BinaryTrieNode(self.data, self.root_offset, threshold)
+        if self.templates_offset:
+            root.templates = BinaryTemplates(self.data, self.templates_offset, threshold)
+        return root
+
+    def _entry(self, i):
+        offset, length, score = ENTRY.unpack_from(self.data, self.entries_offset + ENTRY.size * i)
+        start = self.paths_offset + offset
+        return self.data[start:start + length], score
+
+    def get(self, path, default=None):
+        path = encode_path(path)
+        slot = path_hash(path) & (self.slots - 1)
+        while True:
+            entry = SLOT.unpack_from(self.data, self.index_offset + SLOT.size * slot)[0]
+            if not entry:
+                return default
+            entry_path, score = self._entry(entry - 1)
+            if entry_path == path:
+                return score
+            slot = (slot + 1) & (self.slots - 1)
+
+    def __getitem__(self, path):
+        score = self.get(path)
+        if score is None:
+            raise KeyError(path)
+        return score
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __len__(self):
+        return self.size
+
+    def iteritems(self):
+        """Generate (path, score) pairs, sorted by path"""
+        for i in xrange(self.size):
+            path, score = self._entry(i)
+            yield path.decode("utf-8"), score
+
+    def __iter__(self):
+        for path, score in self.iteritems():
+            yield path
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self)
+
+
+def load_cleanup_model(filename):
+    """Load a cleanup model from a file in any of the supported formats.
+
+    Binary models are memory-mapped; models written as Python dictionaries are parsed as
+    literals (not evaluated as code). Pickled models are unpickled, so they should come
+    from a trusted source.
+    """
+
+    f = open(filename, 'rb')
+    start = f.read(len(BINARY_MODEL_MAGIC))
+    if start == BINARY_MODEL_MAGIC:
+        f.close()
+        return BinaryCleanupModel(filename)
+
+    f.seek(0)
+    if start.startswith('\x80'):
+        # Pickle protocol 2 or higher
+        model = cPickle.load(f)
+    else:
+        model = ast.literal_eval(f.read().strip())
+    f.close()
+    return model
+
+
+def model_size(model):
+    """Estimate the memory taken by a loaded cleanup model, or by a trie compiled from it, in bytes"""
+
+    if isinstance(model, (BinaryCleanupModel, BinaryTrieNode)):
+        return len(model.data)
+    size = sys.getsizeof(model)
+    for key, value in model.iteritems():
+        size += sys.getsizeof(key)
+        if isinstance(value, dict):
+            size += model_size(value)
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+
+def model_version(model):
+    """Return a string that changes when a cleanup model (a file name or a loaded model) changes"""
+
+    if isinstance(model, basestring):
+        stat = os.stat(model)
+        return '%d-%r' % (stat.st_size, stat.st_mtime)
+    if isinstance(model, BinaryCleanupModel):
+        return '%08x' % (zlib.crc32(model.data) & 0xffffffff)
+    return '%08x' % (zlib.crc32(repr(sorted(model.items()))) & 0xffffffff)
+
+
+class CleanupModelRegistry:
+    """Cleanup models of several websites, chosen by the names of input files.
+
+    The registry maps keys to models (or files with models). A key is either a path prefix 
+    (starting with '/'), matched against absolute file names, or a host name, matched against 
+    the directory names in file names (e.g., .../www.example.com/forum/index.html). The longest 
+    matching prefix is used; host names are tried if no prefix matches.
+
+    Models are loaded when first needed, and optionally converted with compile() (e.g., to
+    an index used for cleaning). When the estimated size of loaded models exceeds memory_limit 
+    (in bytes), the least recently used models are unloaded. Loading and unloading is logged to
+    STDERR, unless quiet.
+    """
+
+    def __init__(self, registry, memory_limit=1024 * 2**20, compile=None, quiet=False):
+        """Create a registry from a dictionary (key -> model or model file name) or from a file.
+
+        In a registry file, each line contains a key and a model file name, separated by whitespace;
+        relative file names are relative to the directory of the registry file. Empty lines and 
+        lines starting with '#' are ignored.
+        """
+
+        if isinstance(registry, basestring):
+            registry = self.read_registry(registry)
+
+        self.prefixes = dict()
+        self.hosts = dict()
+        for key, model in registry.items():
+            if key.startswith('/'):
+                self.prefixes[os.path.abspath(key)] = model
+            else:
+                self.hosts[key] = model
+
+        self.memory_limit = memory_limit
+        self.memory = 0
+        self.compile = compile
+        self.quiet = quiet
+
+        ## loaded models, from least to most recently used: key -> (model, size)
+        self.loaded = OrderedDict()
+
+    @staticmethod
+    def read_registry(filename):
+        registry = dict()
+        base_dir = os.path.dirname(os.path.abspath(filename))
+        for line in open(filename):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, model_file = line.split(None, 1)
+            registry[key] = os.path.join(base_dir, model_file)
+        return registry
+
+    def find(self, filename):
+        """Return the key of the model for a file, or None"""
+
+        filename = os.path.abspath(filename)
+        # Prefixes match whole path components: /data/site is not a prefix of /data/site2/page.html
+        prefixes = [prefix for prefix in self.prefixes
+                    if filename == prefix or filename.startswith(prefix.rstrip('/') + '/')]
+        if prefixes:
+            return max(prefixes, key=len)
+        for directory in os.path.dirname(filename).split('/'):
+            if directory in self.hosts:
+                return directory
+        return None
+
+    def get_source(self, filename):
+        """Return the model or model file name registered for a file, without loading it, or None"""
+
+        key = filename and self.find(filename)
+        if key is None:
+            return None
+        return self.prefixes.get(key, self.hosts.get(key))
+
+    def get_model(self, filename):
+        """Return the (compiled) cleanup model for a file, or None if no model is registered for it"""
+
+        key = filename and self.find(filename)
+        if key is None:
+            return None
+
+        if key in self.loaded:
+            model, size = self.loaded.pop(key)
+            self.loaded[key] = (model, size)
+            return model
+
+        model = self.prefixes.get(key, self.hosts.get(key))
+        if isinstance(model, basestring):
+            if not self.quiet:
+                print >>sys.stderr, '    ', "loading cleanup model", model
+            model = load_cleanup_model(model)
+        if self.compile:
+            model = self.compile(model)
+        # Size of the model as used: compiled tries can be much larger than the model
+        size = model_size(model)
+        self.loaded[key] = (model, size)
+        self.memory += size
+
+        # Unload least recently used models, keeping the one just loaded
+        while self.memory > self.memory_limit and len(self.loaded) > 1:
+            old_key, (old_model, old_size) = self.loaded.popitem(last=False)
+            self.memory -= old_size
+            if not self.quiet:
+                print >>sys.stderr, '    ', "unloading cleanup model for", old_key
+
+        return model
@@ -0,0 +1,140 @@
+"""HTML parsers: build BeautifulSoup trees from HTML documents
+
+All parsers return instances of BeautifulSoup (version 3), with entities converted to
+Unicode characters, so that extractors can use the same interface (find(), findAll(),
+contents, extract(), etc.) whatever parser is used.
+
+ - 'beautifulsoup': the parser of BeautifulSoup (default)
+ - 'lxml': the HTML parser of libxml2 (requires lxml); much faster, but recovers from
+   broken markup differently and drops whitespace between some elements (e.g., table
+   rows), so cleanup models should be learned and applied with the same parser
+"""
+
+from BeautifulSoup import BeautifulSoup, BeautifulStoneSoup, Tag, UnicodeDammit
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+def parse_with_beautifulsoup(html, encoding):
+    return BeautifulSoup(html, fromEncoding=encoding, convertEntities=BeautifulStoneSoup.HTML_ENTITIES)
+
+
+def parse_with_lxml(html, encoding):
+    # Decode the document exactly as BeautifulSoup does
+    if not isinstance(html, unicode):
+        html = UnicodeDammit(html, [encoding], smartQuotesTo=None, isHTML=True).unicode or u''
+
+    builder = SoupBuilder(BeautifulSoup(u'', convertEntities=BeautifulStoneSoup.HTML_ENTITIES))
+    root = None
+    if html.strip():
+        root = etree.fromstring(html.encode('utf-8'), etree.HTMLParser(encoding='utf-8'))
+    if root is not None:
+        doctype = root.getroottree().docinfo
+        if doctype.doctype:
+            builder.doctype(doctype.root_name, doctype.public_id, doctype.system_url)
+        # Comments and processing instructions may precede or follow the root element
+        nodes = list(root.itersiblings(preceding=True))
+        nodes.reverse()
+        nodes.append(root)
+        nodes.extend(root.itersiblings())
+        builder.add(nodes)
+    return builder.close()
+
+
+class SoupBuilder:
+    """Build a BeautifulSoup tree from an lxml tree.
+
+    Uses the tree building methods of BeautifulSoup (so texts are merged and whitespace is
+    normalized as by BeautifulSoup), but elements are nested as in the lxml tree.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+
+    def add(self, nodes):
+        """Add lxml nodes (and their descendants) to the tree, without recursion"""
+
+        # Stack of elements being added, with iterators over their children
+        stack = [(None, iter(nodes))]
+        while stack:
+            element, children = stack[-1]
+            for node in children:
+                if isinstance(node.tag, basestring):
+                    self.start(node.tag, node.items())
+                    if node.text:
+                        self.data(node.text)
+                    stack.append((node, iter(node)))
+                    break
+                elif node.tag is etree.Comment:
+                    self.comment(node.text or '')
+                elif node.tag is etree.PI:
+                    self.pi(node.target, node.text)
+                if node.tail:
+                    self.data(node.tail)
+            else:
+                stack.pop()
+                if element is not None:
+                    self.end(element.tag)
+                    if element.tail:
+                        self.data(element.tail)
+
+    def start(self, name, attrs):
+        soup = self.soup
+        soup.endData()
+        tag = Tag(soup, to_unicode(name), None, soup.currentTag, soup.previous)
+        # Entities in values were converted by lxml already (Tag() would convert them again)
+        tag.attrs = [(to_unicode(key), to_unicode(value)) for key, value in attrs]
+        if soup.previous:
+            soup.previous.next = tag
+        soup.previous = tag
+        soup.pushTag(tag)
+
+    def end(self, name):
+        self.soup.endData()
+        self.soup.popTag()
+
+    def data(self, data):
+        self.soup.handle_data(to_unicode(data))
+
+    def comment(self, text):
+        self.soup.handle_comment(to_unicode(text))
+
+    def doctype(self, name, public_id, system_url):
+        declaration = u'DOCTYPE ' + to_unicode(name or 'html')
+        if public_id:
+            declaration += u' PUBLIC "%s"' % to_unicode(public_id)
+        if system_url:
+            declaration += u' "%s"' % to_unicode(system_url)
+        self.soup.handle_decl(declaration)
+
+    def pi(self, target, data):
+        self.soup.handle_pi(to_unicode(target) + u' ' + to_unicode(data or ''))
+
+    def close(self):
+        soup = self.soup
+        soup.endData()
+        while soup.currentTag.name != soup.ROOT_TAG_NAME:
+            soup.popTag()
+        return soup
+
+
+def to_unicode(s):
+    # lxml returns strings as str if they are pure ASCII
+    if isinstance(s, unicode):
+        return s
+    return unicode(s)
+
+
+PARSERS = {'beautifulsoup': parse_with_beautifulsoup,
+           'lxml': parse_with_lxml}
+
+
+def get_parser(name):
+    """Return the function that parses an HTML document (a string in a given encoding) with a given parser"""
+
+    assert name in PARSERS, "unknown parser %s (available: %s)" % (name, ', '.join(sorted(PARSERS)))
+    assert name != 'lxml' or etree is not None, "the lxml parser requires the lxml package"
+    return PARSERS[name]
@@ -0,0 +1,155 @@
+"""Output of extracted records (see elements.py) as JSON and as tables
+
+Records are converted to JSON objects: fields of a record become keys (in addition to
+'_type', the name of the record class, and '_filename' for top-level records), nested records
+become nested objects. Tables hold one row per record, one table per record type; nested
+records are linked to their parents with columns '_id' and '_parent_id'.
+"""
+
+import os, sys
+import re
+import csv
+import json
+from datetime import datetime, date
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Output formats written as tables (to a directory) by TableWriter
+TABLE_FORMATS = ('csv', 'parquet')
+
+# Number of rows of a table written to one file (part of the table)
+TABLE_BATCH_SIZE = 10000
+
+
+def record_type(obj):
+    """Name of the type of a record: its class name in lowercase"""
+    return re.sub('.*\.', '', str(obj.__class__).lower())
+
+
+def record_to_json(obj, clean_string):
+    """Convert a record (or a list, a string, a number, a date) to a value that can be serialized
+    to JSON; strings are normalized with clean_string()"""
+
+    if isinstance(obj, (bool, int, long, float)):
+        return obj
+    elif isinstance(obj, (datetime, date)):
+        return unicode(obj)
+    elif isinstance(obj, basestring):
+        return clean_string(obj)
+    elif isinstance(obj, list):
+        return [record_to_json(elt, clean_string) for elt in obj]
+    elif hasattr(obj, '__dict__'):
+        res = {'_type': record_type(obj)}
+        for name, value in obj.__dict__.items():
+            res[name] = record_to_json(value, clean_string)
+        return res
+    else:
+        raise NotImplementedError("don't know how to serialize %s %s", type(obj), obj)
+
+
+def is_record(value):
+    return isinstance(value, dict) or (isinstance(value, list) and value and isinstance(value[0], dict))
+
+
+class TableWriter:
+    """Write records (as returned by record_to_json()) to tables, one per record type.
+
+    Each table is a directory with files (parts) of up to batch_size rows, in CSV (UTF-8) or
+    Parquet format (requires pyarrow). Columns of a part are those of its rows: '_id',
+    '_parent_id' and '_filename' first, then the fields of the records in alphabetical order.
+    Lists of values are written as JSON. Parts are logged to STDERR as they are written, unless quiet.
+    """
+
+    def __init__(self, directory, format='csv', batch_size=TABLE_BATCH_SIZE, quiet=False):
+        assert format in TABLE_FORMATS, "unknown table format " + format
+        assert format != 'parquet' or pyarrow is not None, "the parquet format requires pyarrow"
+        self.directory = directory
+        self.format = format
+        self.batch_size = batch_size
+        self.quiet = quiet
+
+        self.last_id = 0
+
+        ## rows not written yet, by table
+        self.rows = dict()
+
+        ## number of parts written, by table
+        self.parts = dict()
+
+    def add(self, record, parent_id=None):
+        """Add a record and its nested records to the tables"""
+
+        self.last_id += 1
+        row = {'_id': self.last_id}
+        if parent_id is not None:
+            row['_parent_id'] = parent_id
+        children = []
+        for name, value in record.items():
+            if name == '_type':
+                continue
+            if is_record(value):
+                children.append(value)
+            elif isinstance(value, list):
+                row[name] = json.dumps(value, ensure_ascii=False)
+            else:
+                row[name] = value
+
+        table = record['_type']
+        self.rows.setdefault(table, []).append(row)
+        if len(self.rows[table]) >= self.batch_size:
+            self.flush(table)
+
+        for child in children:
+            if isinstance(child, dict):
+                child = [child]
+            for child_record in child:
+                self.add(child_record, row['_id'])
+
+    def flush(self, table):
+        """Write the rows of a table added so far to a new part of the table"""
+
+        rows = self.rows.pop(table, None)
+        if not rows:
+            return
+        part = self.parts.get(table, 0)
+        self.parts[table] = part + 1
+
+        table_dir = os.path.join(self.directory, table)
+        if not os.path.isdir(table_dir):
+            os.makedirs(table_dir)
+        filename = os.path.join(table_dir, "part-%05d.%s" % (part, self.format))
+        if not self.quiet:
+            print >>sys.stderr, '    ', "saving %d rows to" % len(rows), filename
+
+        fields = set()
+        for row in rows:
+            fields.update(row)
+        first_columns = [column for column in ('_id', '_parent_id', '_filename') if column in fields]
+        columns = first_columns + sorted(fields.difference(first_columns))
+
+        if self.format == 'parquet':
+            arrays = [pyarrow.array([format_value(row.get(column)) for row in rows], type=pyarrow.string())
+                      for column in columns]
+            pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, columns), filename)
+        else:
+            f = open(filename, 'wb')
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([(format_value(row.get(column)) or u'').encode("utf-8") for column in columns])
+            f.close()
+
+    def close(self):
+        """Write all remaining rows"""
+        for table in sorted(self.rows):
+            self.flush(table)
+
+
+def format_value(value):
+    if value is None:
+        return None
+    return unicode(value)
@@ -0,0 +1,150 @@
+"""Output sinks: where extractors save per-file outputs (see Extractor option output_dir)
+
+Outputs are buffered and written in batches, by the main process only.
+
+ - DirectorySink: one file per output in a directory tree; directories are created once, and
+   existing files are found by listing each directory once instead of checking every file
+ - TarSink: all outputs appended to a single (uncompressed) tar archive, so that millions of
+   small outputs do not hit the filesystem one by one; outputs already in the archive are
+   found from its index when it is opened
+"""
+
+import os, sys
+import time
+import tarfile
+from cStringIO import StringIO
+
+# Maximal size of buffered outputs, in bytes, and maximal number of buffered outputs
+OUTPUT_BATCH_SIZE = 4 * 2**20
+OUTPUT_BATCH_FILES = 1000
+
+
+class Output:
+    """Formatted output of a file, to be saved to a sink under a (relative) name"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+
+class OutputSink:
+    """Buffer outputs and write them in batches; descendants define write_batch() (and log
+    batches to STDERR, unless quiet)"""
+
+    def __init__(self, batch_size=OUTPUT_BATCH_SIZE, batch_files=OUTPUT_BATCH_FILES, quiet=False):
+        self.batch_size = batch_size
+        self.batch_files = batch_files
+        self.quiet = quiet
+
+        ## outputs not written yet
+        self.outputs = []
+        self.buffered_size = 0
+
+        ## names of outputs buffered or reserved, not written yet
+        self.pending_names = set()
+
+    def exists(self, name):
+        """Check whether an output with a given name was saved (or is about to be); descendants
+        also check outputs already written"""
+        return name in self.pending_names
+
+    def reserve(self, name):
+        """Mark an output as about to be saved, before it is written"""
+        self.pending_names.add(name)
+
+    def write(self, output):
+        """Buffer an output; return whether buffered outputs were written"""
+
+        self.pending_names.add(output.name)
+        self.outputs.append(output)
+        self.buffered_size += len(output.data)
+        if self.buffered_size >= self.batch_size or len(self.outputs) >= self.batch_files:
+            return self.flush()
+        return False
+
+    def flush(self):
+        """Write buffered outputs; return whether there were any"""
+
+        if not self.outputs:
+            return False
+        outputs = self.outputs
+        self.outputs = []
+        self.buffered_size = 0
+        self.write_batch(outputs)
+        self.pending_names.difference_update([output.name for output in outputs])
+        return True
+
+    def write_batch(self, outputs):
+        raise NotImplementedError()
+
+    def close(self):
+        self.flush()
+
+
+class DirectorySink(OutputSink):
+    """Save outputs as files in a directory"""
+
+    def __init__(self, directory, **kwargs):
+        OutputSink.__init__(self, **kwargs)
+        self.directory = directory
+
+        ## names of files, by directory, for directories listed or created so far
+        self.listed = dict()
+
+    def _files(self, dir_name):
+        if dir_name not in self.listed:
+            try:
+                self.listed[dir_name] = set(os.listdir(dir_name))
+            except OSError:
+                self.listed[dir_name] = None
+        return self.listed[dir_name]
+
+    def exists(self, name):
+        dir_name, base_name = os.path.split(os.path.join(self.directory, name))
+        files = self._files(dir_name)
+        return OutputSink.exists(self, name) or (files is not None and base_name in files)
+
+    def write_batch(self, outputs):
+        if not self.quiet:
+            print >>sys.stderr, '    ', "saving %d outputs to" % len(outputs), self.directory
+        for output in outputs:
+            filename = os.path.join(self.directory, output.name)
+            dir_name, base_name = os.path.split(filename)
+            files = self._files(dir_name)
+            if files is None:
+                if not os.path.isdir(dir_name):
+                    os.makedirs(dir_name)
+                files = self.listed[dir_name] = set()
+            f = open(filename, 'wb')
+            f.write(output.data)
+            f.close()
+            files.add(base_name)
+
+
+class TarSink(OutputSink):
+    """Append outputs to a tar archive, as members named after the outputs"""
+
+    def __init__(self, filename, **kwargs):
+        OutputSink.__init__(self, **kwargs)
+        self.filename = filename
+        self.archive = tarfile.open(filename, 'a')
+        self.names = set(self.archive.getnames())
+
+    def exists(self, name):
+        return OutputSink.exists(self, name) or name in self.names
+
+    def write_batch(self, outputs):
+        if not self.quiet:
+            print >>sys.stderr, '    ', "saving %d outputs to" % len(outputs), self.filename
+        now = time.time()
+        for output in outputs:
+            info = tarfile.TarInfo(output.name)
+            info.size = len(output.data)
+            info.mtime = now
+            self.archive.addfile(info, StringIO(output.data))
+            self.names.add(output.name)
+        self.archive.fileobj.flush()
+
+    def close(self):
+        OutputSink.close(self)
+        self.archive.close()
@@ -0,0 +1,198 @@
+"""Input sources: documents stored in crawl archives
+
+Crawls stored as WARC files (optionally gzipped, record by record or as a whole), tar archives
+(optionally compressed) and zip archives are read record by record, without unpacking them.
+Uncompressed WARC files are memory-mapped; other archives are read as streams (tar) or
+member by member (zip).
+
+iter_archive() generates (name, data) for each document: for WARC files, the target URI and
+the body of each successful HTTP response (or each resource record); for tar and zip
+archives, the name and content of each member.
+"""
+
+import os, sys
+import re
+import mmap
+import gzip
+import zlib
+import tarfile
+import zipfile
+
+# Archive types by file name suffix (the first matching suffix is used)
+ARCHIVE_SUFFIXES = [('.warc', 'warc'), ('.warc.gz', 'warc'),
+                    ('.tar', 'tar'), ('.tar.gz', 'tar'), ('.tgz', 'tar'), ('.tar.bz2', 'tar'),
+                    ('.zip', 'zip')]
+
+
+def archive_type(filename):
+    """Return the type of archive a file is ('warc', 'tar' or 'zip'), judging by its name, or None"""
+
+    for suffix, type in ARCHIVE_SUFFIXES:
+        if filename.endswith(suffix):
+            return type
+    return None
+
+
+def iter_archive(filename):
+    """Generate (name, data) for all documents in an archive"""
+
+    type = archive_type(filename)
+    assert type, filename + " is not a supported archive"
+    if type == 'warc':
+        return iter_warc(filename)
+    elif type == 'tar':
+        return iter_tar(filename)
+    else:
+        return iter_zip(filename)
+
+
+def open_mapped(filename):
+    """Return a memory map of a file (a file-like object), or the file itself if it is empty"""
+
+    f = open(filename, 'rb')
+    if not os.fstat(f.fileno()).st_size:
+        return f
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    f.close()
+    return data
+
+
+def iter_warc(filename):
+    """Generate (target URI, body) for HTTP responses with status 2xx and resource records of a WARC file"""
+
+    if filename.endswith('.gz'):
+        # Concatenated gzip members (one per record) are read as one stream
+        f = gzip.open(filename, 'rb')
+    else:
+        f = open_mapped(filename)
+
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        assert line.startswith('WARC/'), "%s: WARC record expected at offset %d" % (filename, f.tell() - len(line))
+
+        headers = read_headers(f)
+        block = f.read(int(headers.get('content-length', 0)))
+        record_type = headers.get('warc-type')
+        uri = headers.get('warc-target-uri', headers.get('warc-record-id', '')).strip('<>')
+
+        if record_type == 'response' and headers.get('content-type', '').startswith('application/http'):
+            try:
+                status, body = parse_http_response(block)
+            except (ValueError, zlib.error), e:
+                print >>sys.stderr, "ERROR reading HTTP response of", uri, "in", filename, ":", e
+                continue
+            if 200 <= status < 300:
+                yield uri, body
+        elif record_type == 'resource':
+            yield uri, block
+    f.close()
+
+
+def read_headers(f):
+    """Read header lines up to an empty line; return a dictionary: lowercase name -> value"""
+
+    headers = dict()
+    while True:
+        line = f.readline()
+        if not line.strip():
+            return headers
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+
+HTTP_STATUS = re.compile(r'HTTP/\d\.\d\s+(\d{3})')
+
+
+def parse_http_response(block):
+    """Return the status code and the (decoded) body of an HTTP response"""
+
+    header_end = block.find('\r\n\r\n')
+    separator = 4
+    if header_end < 0:
+        header_end = block.find('\n\n')
+        separator = 2
+    if header_end < 0:
+        header_end = len(block)
+    lines = block[:header_end].splitlines()
+    body = block[header_end + separator:]
+
+    match = lines and HTTP_STATUS.match(lines[0])
+    if not match:
+        raise ValueError("no HTTP status line")
+    status = int(match.group(1))
+
+    headers = dict()
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        body = decode_chunked(body)
+    encoding = headers.get('content-encoding', '')
+    if encoding in ('gzip', 'x-gzip'):
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            # Raw deflate data, without zlib header
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    return status, body
+
+
+def decode_chunked(body):
+    """Decode a body with chunked transfer encoding"""
+
+    chunks = []
+    position = 0
+    while position < len(body):
+        line_end = body.find('\n', position)
+        if line_end < 0:
+            break
+        size = int(body[position:line_end].split(';')[0].strip() or '0', 16)
+        if size == 0:
+            break
+        chunks.append(body[line_end + 1:line_end + 1 + size])
+        position = line_end + 1 + size
+        # Skip CRLF after the chunk
+        while body[position:position + 1] in ('\r', '\n') and position < len(body):
+            position += 1
+    return ''.join(chunks)
+
+
+def iter_tar(filename):
+    """Generate (member name, content) for regular files in a tar archive, read as a stream"""
+
+    archive = tarfile.open(filename, 'r|*')
+    for member in archive:
+        if member.isfile():
+            f = archive.extractfile(member)
+            yield member.name, f.read()
+            f.close()
+    archive.close()
+
+
+def iter_zip(filename):
+    """Generate (member name, content) for files in a zip archive"""
+
+    archive = zipfile.ZipFile(filename)
+    for info in archive.infolist():
+        if not info.filename.endswith('/'):
+            yield info.filename, archive.read(info)
+    archive.close()
+
+
+def document_path(name):
+    """Return a relative path for a document from an archive (e.g. to name its output): the URL
+    without the scheme or the member name, without empty, '.' and '..' components"""
+
+    path = re.sub(r'^[a-zA-Z][-+.\w]*://', '', name)
+    if not path or path.endswith('/'):
+        path += 'index.html'
+    return '/'.join([part for part in path.split('/') if part not in ('', '.', '..')])
@@ -12,7 +12,7 @@ class LentaExtractor(Extractor):
 
 
 
-    def extract_from_soup(self, soup, file_name):
+    def extract_from_soup(self, soup, filename=None, relative_filename=None):
 
         # Find content
         content = soup.find("td", { "class" : "statya" })
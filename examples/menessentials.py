@@ -74,7 +74,7 @@ class MenessentialsForumExtractor(Extractor):
                 
             
 
-        print >>sys.stderr, '    ', len(posts), 'posts'
+        self.log('    ', len(posts), 'posts')
         return posts
 
 
@@ -109,7 +109,7 @@ class MenessentialsForumExtractor(Extractor):
         span = soup.find(text='Interests:&nbsp;')
         profile.interests = self.get_text(span.parent.parent.findNextSiblings('td')[0])
         
-        print >>sys.stderr, '    profile for', profile.user_name
+        self.log('    profile for', profile.user_name)
         
         return profile
 
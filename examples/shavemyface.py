@@ -110,7 +110,7 @@ class ShavemyfaceForumExtractor(Extractor):
             
                     
 
-        print >>sys.stderr, '    ', len(posts), 'posts'
+        self.log('    ', len(posts), 'posts')
         return posts
 
 
@@ -147,7 +147,7 @@ class ShavemyfaceForumExtractor(Extractor):
             elif attr.string == 'Interests:&nbsp;':
                 profile.interests = value.string
             
-        print >>sys.stderr, '    profile for', profile.user_name
+        self.log('    profile for', profile.user_name)
         
         return profile
 
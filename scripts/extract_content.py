@@ -9,7 +9,10 @@ from content_extraction.cleanup import PageCleaner
 parser = OptionParser("usage: %prog [options] extractor input_files_or_dirs...",
                       description="""Extract text content from files using a specific extractor.
                                      Parameter 'extractor' can be either 'cleanup' or the path to a python module
-                                     providing a specific extractor implementation (see examples/*.py).""")
+                                     providing a specific extractor implementation (see examples/*.py).
+                                     Input files can also be crawl archives: WARC (.warc, .warc.gz), tar 
+                                     (.tar, .tar.gz, .tgz, .tar.bz2) or zip (.zip) files; documents in WARC 
+                                     files are named after their URL.""")
 
 parser.add_option("-e", "--encoding", dest="encoding", 
                   help="character encoding of the input files (by default, encoding will be guessed automatically)",
@@ -21,10 +24,23 @@ parser.add_option("-o", "--output_dir", dest="output_dir",
                   metavar="DIR",
                   default=None)
 
+parser.add_option("-a", "--output_archive", dest="output_archive", 
+                  help="""tar archive where the output will be stored instead of --output_dir, one member per 
+                          input file; outputs are appended to an existing archive""", 
+                  metavar="FILE",
+                  default=None)
+
+parser.add_option("--manifest", dest="manifest", 
+                  help="""file where sizes, modification times and digests of processed input files are kept
+                          (created if needed); only new or changed input files, or all files if the extractor
+                          or the cleanup model changed, are then processed, and their outputs overwritten""", 
+                  metavar="FILE",
+                  default=None)
+
 parser.add_option("-f", "--flat", dest="flatten_files", action="store_true",
                   help="""flatten directory structure and assign simple numerical filenames to output files
                           (default: keep filenames as they were in the input);
-                          this option only makes sense if --output_dir is used""", 
+                          this option only makes sense if --output_dir or --output_archive is used""", 
                   default=False)
 
 parser.add_option("-w", "--overwrite", dest="overwrite", action="store_true",
@@ -32,21 +48,92 @@ parser.add_option("-w", "--overwrite", dest="overwrite", action="store_true",
                   default=False)
 
 parser.add_option("-O", "--output_format", dest="output_format", 
-                  help="output format: 'xml', 'html' or 'txt' (default: xml)", 
+                  help="""output format: 'xml', 'html', 'txt', 'jsonl' (JSON Lines), or 'csv' or 'parquet'
+                          (tables of records, one directory per record type, in the output directory;
+                          parquet requires pyarrow) (default: xml)""", 
                   default='xml')
 
 parser.add_option("-m", "--cleanup_model", dest="cleanup_model", 
-                  help="""file containing a website-specific cleanup model, generated by learn_cleanup_model.py
+                  help="""file containing a website-specific cleanup model, generated by learn_cleanup_model.py in any format
                           (default: don't perform site-specific cleanup)""", 
                   metavar="FILE",   
                   default=None)
 
+parser.add_option("-P", "--parser", dest="parser", 
+                  help="""HTML parser: beautifulsoup (default) or lxml (faster, requires lxml); cleanup models 
+                          should be learned with the same parser""", 
+                  choices=['beautifulsoup', 'lxml'],        
+                  default='beautifulsoup')
+
+parser.add_option("-M", "--model_registry", dest="model_registry", 
+                  help="""file listing cleanup models of several websites, one per line: a host name (matched against
+                          directory names of input files) or a path prefix, and a model file; files of websites
+                          without a model are cleaned with --cleanup_model, if given""", 
+                  metavar="FILE",   
+                  default=None)
+
+parser.add_option("--model_memory", dest="model_memory", 
+                  help="""memory limit for cleanup models loaded from --model_registry, in megabytes; least recently
+                          used models are unloaded (default: 1024)""", 
+                  type='float',        
+                  metavar="MB",   
+                  default=1024)
+
 parser.add_option("-t", "--cleanup_threshold", dest="cleanup_threshold", 
                   help="""threshold for controling site-specific cleanup: a number between 0 and 1; higher value = more conservative cleanup
                           (default: 0.1)""", 
                   type='float',        
                   metavar="NUM",   
                   default=0.1)
+
+parser.add_option("-j", "--jobs", dest="jobs", 
+                  help="""number of worker processes to run the extraction in parallel
+                          (default: 1)""", 
+                  type='int',        
+                  metavar="NUM",   
+                  default=1)
+
+parser.add_option("--prefetch", dest="prefetch", 
+                  help="""number of input files read ahead by a thread while the current file is processed,
+                          when not running workers (default: 0, don't read ahead)""", 
+                  type='int',        
+                  metavar="NUM",   
+                  default=0)
+
+parser.add_option("-p", "--html_pattern", dest="html_patterns", action="append",
+                  help="""only process files with names matching a glob pattern, e.g. '*.html'; can be repeated
+                          (default: process all files that contain HTML)""", 
+                  metavar="PATTERN",   
+                  default=None)
+
+parser.add_option("-q", "--quiet", dest="quiet", action="store_true",
+                  help="don't log processed files to STDERR (errors are still reported)", 
+                  default=False)
+
+parser.add_option("--stats", dest="stats", 
+                  help="""write time, bytes and nodes by processing stage (read, parse, cleanup, extract, etc.), 
+                          summed over all pages, to FILE as JSON, and print them to STDERR""", 
+                  metavar="FILE",
+                  default=None)
+
+parser.add_option("--trace", dest="trace", 
+                  help="write time, bytes and nodes by processing stage for each page to FILE, as JSON lines", 
+                  metavar="FILE",
+                  default=None)
+parser.add_option("--near_duplicates", dest="near_duplicates", 
+                  help="""skip pages whose text is a near-duplicate of a page processed before: pages 
+                          whose text fingerprints agree in at least this fraction of bits (e.g. 0.95)""", 
+                  metavar="SIMILARITY",
+                  type='float',
+                  default=None)
+parser.add_option("--near_duplicates_list", dest="near_duplicates_list", 
+                  help="list skipped near-duplicates with the pages they duplicate in FILE (tab-separated)", 
+                  metavar="FILE",
+                  default=None)
+
+parser.add_option("-r", "--encoding_report", dest="encoding_report", action="store_true",
+                  help="print statistics of character encoding detection to STDERR at the end", 
+                  default=False)
                   
                   
 (options, params) = parser.parse_args()
@@ -76,3 +163,9 @@ extractor = extractor_class(**options.__dict__)
 # Call extractor for all input files/dirs
 extractor.extract(files=input_files, output=sys.stdout)
 
+if options.encoding_report:
+    print >>sys.stderr, extractor.encoding_detector.report()
+
+if options.stats:
+    print >>sys.stderr, extractor.instrumentation.report()
+
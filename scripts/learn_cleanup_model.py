@@ -1,4 +1,7 @@
 """Generate model for cleaning up pages of a crawled website
+
+Counts can be learned from parts of a crawl separately (--dump_counts) and merged into
+one model (--merge_counts). Input files can also be crawl archives (WARC, tar or zip files).
 """
 
 import os, sys
@@ -13,20 +16,98 @@ if __name__ == "__main__":
                           description=__doc__)
 
     parser.add_option("-O", "--output_format", dest="output_format", 
-                      help="output format: pickle or python (default: python)", 
+                      help="""output format: python, pickle or binary; binary models load fastest
+                              (default: python)""", 
                       default='python')
     parser.add_option("-d", "--max_duplicates", dest="max_duplicates", 
                       help="""Maximum number of duplicate files in the input dataset
                               (default: 2)""", 
                       metavar="NUM",   
                       default=2)
+    parser.add_option("-c", "--compact", dest="compact", action="store_true",
+                      help="""keep digests of texts instead of texts while learning: uses much less memory
+                              (default: keep texts)""", 
+                      default=False)
+    parser.add_option("-s", "--sketch_memory", dest="sketch_memory", 
+                      help="""learn an approximate model in bounded memory, keeping counts of texts in a
+                              count-min sketch of this size in megabytes; every page element path takes
+                              another 2 KB (default: count exactly)""", 
+                      metavar="MB",   
+                      type='float',
+                      default=None)
+    parser.add_option("-t", "--templates", dest="templates", action="store_true",
+                      help="""also learn a model for each template of file names (file names relative to
+                              the input directories, with words and numbers generalized), used instead of
+                              the model of all files to clean files of the template""", 
+                      default=False)
+    parser.add_option("--min_template_pages", dest="min_template_pages", 
+                      help="""minimum number of files of a template for its model to be kept; files of
+                              rarer templates are cleaned with the model of all files (default: 10)""", 
+                      metavar="NUM",   
+                      type='int',
+                      default=10)
+    parser.add_option("-j", "--jobs", dest="jobs", 
+                      help="number of worker processes that learn from parts of the input files (default: 1)", 
+                      metavar="NUM",   
+                      type='int',
+                      default=1)
+    parser.add_option("-P", "--parser", dest="parser",
+                      help="""HTML parser: beautifulsoup (default) or lxml (faster, requires lxml); pages
+                              should be cleaned with the same parser""",
+                      choices=['beautifulsoup', 'lxml'],
+                      default='beautifulsoup')
+    parser.add_option("--near_duplicates", dest="near_duplicates", 
+                      help="""do not learn from pages whose text is a near-duplicate of a page learned
+                              from before: pages whose text fingerprints agree in at least this fraction
+                              of bits (e.g. 0.95); with -j, near-duplicates are detected within the files
+                              of each worker""", 
+                      metavar="SIMILARITY",
+                      type='float',
+                      default=None)
+    parser.add_option("--sample", dest="sample",
+                      help="""learn from files in random order (random) or in random order with all
+                              templates of file names represented in proportion (stratified), and stop
+                              when the model converges; reports the number of files used""",
+                      choices=['random', 'stratified'],
+                      default=None)
+    parser.add_option("--tolerance", dest="tolerance", 
+                      help="""with --sample: the model has converged when scores of paths changed on
+                              average by at most this between two checks (default: 0.01)""", 
+                      type='float',
+                      default=0.01)
+    parser.add_option("--check_interval", dest="check_interval", 
+                      help="with --sample: number of files between checks of convergence (default: 200)", 
+                      metavar="NUM",   
+                      type='int',
+                      default=200)
+    parser.add_option("--stable_checks", dest="stable_checks", 
+                      help="""with --sample: number of consecutive checks within --tolerance for the
+                              model to be converged (default: 3)""", 
+                      metavar="NUM",   
+                      type='int',
+                      default=3)
+    parser.add_option("--seed", dest="seed", 
+                      help="with --sample: seed of the random order of files (default: random)", 
+                      type='int',
+                      default=None)
+    parser.add_option("--dump_counts", dest="dump_counts", 
+                      help="""write counts of texts learned from the input files to FILE ('-' for STDOUT)
+                              instead of printing the model; counts from several runs can be merged with
+                              --merge_counts""", 
+                      metavar="FILE",   
+                      default=None)
+    parser.add_option("--merge_counts", dest="merge_counts", action="append",
+                      help="""add counts of texts from FILE, written with --dump_counts, before computing
+                              the model; can be repeated""", 
+                      metavar="FILE",   
+                      default=[])
 
                       
                       
     (options, params) = parser.parse_args()
     options.output_dir = None
         
-    if len(params) < 1:
+    if len(params) < 1 and not options.merge_counts:
         parser.print_help()
         exit(1)
         
@@ -36,5 +117,22 @@ if __name__ == "__main__":
  
     # Call learner for all input files/dirs
     learner.extract(files=input_files)
-        
-    print learner.get_model(format=options.output_format)    
+
+    if options.sample:
+        print >>sys.stderr, learner.sampling_report()
+
+    for counts_file in options.merge_counts:
+        f = open(counts_file, 'rb')
+        learner.merge_counts(f)
+        f.close()
+
+    if options.dump_counts == '-':
+        learner.dump_counts(sys.stdout)
+    elif options.dump_counts:
+        f = open(options.dump_counts, 'wb')
+        learner.dump_counts(f)
+        f.close()
+    elif options.output_format == 'binary':
+        sys.stdout.write(learner.get_model(format='binary'))
+    else:
+        print learner.get_model(format=options.output_format)    